@@ -1,6 +1,6 @@
 from pydantic import AnyUrl
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 from dotenv import load_dotenv
 import os
 
@@ -17,6 +17,25 @@ class Settings(BaseSettings):
     COOKIE_DOMAIN: Optional[str] = None  # set in prod (e.g., .yourdomain.com)
     SECURE_COOKIES: bool = False          # True in prod over HTTPS
 
+    # Diffusion compute (see app/core/executor.py)
+    COMPUTE_EXECUTOR: Literal["thread", "process"] = "thread"
+    COMPUTE_WORKERS: int = 4
+    COMPUTE_MAX_CONCURRENCY: Optional[int] = None  # defaults to COMPUTE_WORKERS
+    X0_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # decoded x0 arrays, per process
+    WS_ENCODE_DEPTH: int = 3  # frames encoding concurrently per /diffuse/ws stream
+    NOISE_THREADS: int = 1  # >1 splits each noise draw across threads (changes noise per seed)
+    NOISE_BANK_DIR: Optional[str] = None  # on-disk noise bank for seeded closed-form draws (/diffuse, batch, sweep)
+    NOISE_BANK_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    NOISE_BANK_DTYPE: Literal["float16", "float32"] = "float32"
+    DIFFUSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # seeded /diffuse responses, per process
+    SESSION_TTL_S: float = 15 * 60  # idle lifetime of a /diffuse/sessions session
+    SESSION_MAX_BYTES: int = 512 * 1024 * 1024  # all sessions together, per process
+    SESSION_FRAME_CACHE_BYTES: int = 16 * 1024 * 1024  # encoded frames, per session
+    SESSION_CHECKPOINT_BYTES: int = 32 * 1024 * 1024  # chain checkpoints, per session
+    EXPORT_TMP_DIR: Optional[str] = None  # session .npy exports (file=true); system temp dir if unset
+    EXPORT_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # those files on disk, all sessions, per process
+    SWEEP_MAX_CHUNK_BYTES: int = 64 * 1024 * 1024  # float32 work buffers per /diffuse/sweep chunk
+
     class Config:
         env_file = ".env"
 
@@ -8,4 +8,6 @@ def add_cors(app):
         allow_credentials=True, 
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["ETag", "X-Diffusion-T", "X-Diffusion-Steps", "X-Diffusion-Schedule",
+                        "X-Diffusion-Width", "X-Diffusion-Height", "X-Diffusion-Seed"],
     )
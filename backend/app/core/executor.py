@@ -0,0 +1,142 @@
+from __future__ import annotations
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+ExecutorKind = Literal["thread", "process"]
+
+
+@dataclass
+class StageTiming:
+    count: int = 0
+    wait_s: float = 0.0   # time spent queued behind the concurrency limit
+    run_s: float = 0.0    # time spent executing in the pool
+    max_run_s: float = 0.0
+
+    def as_dict(self) -> dict:
+        n = max(self.count, 1)
+        return {
+            "count": self.count,
+            "mean_wait_ms": 1000.0 * self.wait_s / n,
+            "mean_run_ms": 1000.0 * self.run_s / n,
+            "max_run_ms": 1000.0 * self.max_run_s,
+        }
+
+
+class ComputeExecutor:
+    """
+    Runs CPU-bound diffusion work off the event loop.
+
+    NumPy and PIL release the GIL for the heavy parts, so a thread pool is the
+    default. With kind="process" self-contained jobs submitted via run() go to a
+    process pool instead; stateful work (live generators, shared buffers) always
+    uses run_threaded(). At most `max_concurrency` jobs run at once, the rest
+    wait, which keeps auth/image requests on the same worker responsive.
+    """
+
+    def __init__(
+        self,
+        kind: ExecutorKind = "thread",
+        max_workers: int = 4,
+        max_concurrency: Optional[int] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError("Unsupported executor kind. Use 'thread' or 'process'.")
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+
+        self.kind = kind
+        self.max_workers = int(max_workers)
+        self.max_concurrency = int(max_concurrency or max_workers)
+
+        self._threads = ThreadPoolExecutor(self.max_workers, thread_name_prefix="compute")
+        self._processes: Optional[ProcessPoolExecutor] = (
+            ProcessPoolExecutor(self.max_workers) if kind == "process" else None
+        )
+        self._limit = asyncio.Semaphore(self.max_concurrency)
+        self._timings: dict[str, StageTiming] = {}
+        self._timings_lock = threading.Lock()
+
+        logger.info("Compute executor: kind=%s, workers=%d, concurrency=%d",
+                    self.kind, self.max_workers, self.max_concurrency)
+
+    # ---------- Public API ----------
+    async def run(self, stage: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a self-contained job. fn and its arguments must be picklable
+        when the executor is process-backed.
+        """
+        return await self._submit(self._processes or self._threads, stage, fn, *args, **kwargs)
+
+    async def run_threaded(self, stage: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Run a job that touches in-process state; always uses the thread pool.
+        """
+        return await self._submit(self._threads, stage, fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._timings_lock:
+            stages = {name: timing.as_dict() for name, timing in self._timings.items()}
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_concurrency": self.max_concurrency,
+            "stages": stages,
+        }
+
+    def shutdown(self) -> None:
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    # ---------- Internals ----------
+    async def _submit(self, pool: Executor, stage: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        queued = time.perf_counter()
+        async with self._limit:
+            started = time.perf_counter()
+            try:
+                return await loop.run_in_executor(pool, call)
+            finally:
+                self._record(stage, started - queued, time.perf_counter() - started)
+
+    def _record(self, stage: str, wait_s: float, run_s: float) -> None:
+        with self._timings_lock:
+            timing = self._timings.setdefault(stage, StageTiming())
+            timing.count += 1
+            timing.wait_s += wait_s
+            timing.run_s += run_s
+            timing.max_run_s = max(timing.max_run_s, run_s)
+        logger.debug("stage=%s wait=%.1fms run=%.1fms", stage, 1000 * wait_s, 1000 * run_s)
+
+
+_executor: Optional[ComputeExecutor] = None
+
+
+def get_executor() -> ComputeExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ComputeExecutor(
+            kind=settings.COMPUTE_EXECUTOR,
+            max_workers=settings.COMPUTE_WORKERS,
+            max_concurrency=settings.COMPUTE_MAX_CONCURRENCY,
+        )
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import logging
+from io import BytesIO
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+logger = logging.getLogger(__name__)
+
+class GifStream:
+    """
+    Incremental animated-GIF writer: header(), then frame() per frame, then
+    TRAILER. Each piece can be sent as soon as it is produced, so a
+    trajectory streams out in bounded memory. Every frame gets its own
+    adaptive 256-colour palette (local colour table); noisy frames quantize
+    poorly against one shared palette.
+    """
+
+    TRAILER = b";"
+
+    def __init__(self, duration_ms: int, loop: int = 0):
+        self.duration_ms = int(duration_ms)
+        self.loop = int(loop)
+
+    def header(self, first: np.ndarray) -> bytes:
+        im = self._quantize(first)
+        chunks, _ = GifImagePlugin.getheader(im, info={"loop": self.loop, "duration": self.duration_ms})
+        return b"".join(chunks)
+
+    def frame(self, arr: np.ndarray) -> bytes:
+        """
+        One frame (graphic control extension + local palette + LZW data).
+        Thread-safe; frames may be encoded concurrently and written in order.
+        """
+        im = self._quantize(arr)
+        return b"".join(GifImagePlugin.getdata(im, duration=self.duration_ms, include_color_table=True))
+
+    @staticmethod
+    def _quantize(arr: np.ndarray) -> Image.Image:
+        return Image.fromarray(arr, mode="RGB").quantize(256, method=Image.Quantize.FASTOCTREE)
+
+
+class _LazyFrames:
+    """
+    Looks like a multi-frame image to Pillow's animated WebP writer, which
+    walks append_images with n_frames/seek(). Each seek pulls the next frame
+    from `next_frame`, so only the current frame is ever held.
+    """
+
+    def __init__(self, next_frame: Callable[[], Optional[np.ndarray]], n_frames: int):
+        self.n_frames = int(n_frames)
+        self._next_frame = next_frame
+        self._current: Optional[Image.Image] = None
+        self._pos = -1
+
+    def seek(self, idx: int) -> None:
+        if idx != self._pos + 1:
+            raise ValueError("frames can only be read in order")
+        arr = self._next_frame()
+        if arr is None:
+            raise EOFError("trajectory ended early")
+        self._current = Image.fromarray(arr, mode="RGB")
+        self._pos = idx
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __getattr__(self, name):
+        # Delegate everything else (mode, convert, getim, ...) to the current frame
+        return getattr(self._current, name)
+
+
+def encode_webp_animation(
+    next_frame: Callable[[], Optional[np.ndarray]],
+    n_frames: int,
+    *,
+    duration_ms: int,
+    quality: int = 80,
+    lossless: bool = False,
+    method: int = 4,
+    loop: int = 0,
+) -> bytes:
+    """
+    Animated WebP from a pull-style frame source (blocking). Frames are fed
+    to libwebp's animation encoder one at a time; it keeps only compressed
+    frames and its working canvas, so memory stays bounded by the output.
+    """
+    first = next_frame()
+    if first is None:
+        raise ValueError("no frames to encode")
+    buff = BytesIO()
+    Image.fromarray(first, mode="RGB").save(
+        buff,
+        format="WEBP",
+        save_all=True,
+        append_images=[_LazyFrames(next_frame, n_frames - 1)] if n_frames > 1 else [],
+        duration=int(duration_ms),
+        loop=int(loop),
+        quality=int(quality),
+        lossless=bool(lossless),
+        method=int(method),
+    )
+    return buff.getvalue()
@@ -1,11 +1,18 @@
 from __future__ import annotations
+import bisect
 import logging
-from typing import Generator, Iterable, Optional, Tuple
+import threading
+from dataclasses import dataclass
+from typing import Generator, Iterable, Optional, Sequence, Tuple
 
 import numpy as np
 
-from app.domain.ImageProcessor import ImageProcessor
-from app.domain.BetaScheduler import BetaScheduler
+from app.domain.ImageProcessor import ImageProcessor, payload_digest
+from app.domain.BetaScheduler import MAX_STEPS, BetaScheduler
+from app.domain.FrameEngine import FrameEngine
+from app.domain.LRUCache import ByteBudgetLRU
+from app.domain.Noise import NoiseProvider, get_noise_provider
+from app.domain.Metrics import MetricsEngine, X0Stats, expected_curves
 
 logger = logging.getLogger(__name__)
 
@@ -19,17 +26,56 @@ def _mix_seed(seed: int, t: int) -> int:
     return (seed ^ (t * 0x9E3779B1)) & 0xFFFFFFFF
 
 
+# Process-wide cache of normalized x0 arrays keyed by (payload digest, max_side).
+# Entries are read-only and shared by every Diffusion built from the same image.
+x0_cache = ByteBudgetLRU(256 * 1024 * 1024)
+
+# Global x0 statistics under the same keys (tiny; the budget counts entries)
+x0_stats_cache = ByteBudgetLRU(4096, sizeof=lambda _: 1)
+
+
+def load_x0(encoded_img: str | bytes, max_side: Optional[int], key: Optional[tuple] = None) -> np.ndarray:
+    """
+    Decode (optionally resize) and normalize to float32 HxWx3 in [0, 1],
+    skipping the whole decode stage when the same payload was seen before.
+    """
+    key = key or (payload_digest(encoded_img), max_side)
+    x0 = x0_cache.get(key)
+    if x0 is None:
+        img = ImageProcessor(encoded_img).decode_image(max_side=max_side)  # HxWx3 uint8
+        x0 = (img.astype(np.float32) / 255.0).clip(0.0, 1.0)
+        x0.setflags(write=False)
+        x0_cache.put(key, x0)
+    return x0
+
+
+@dataclass(frozen=True)
+class SweepPoint:
+    """
+    One cell of a parameter sweep: fast_diffuse(t) under these settings.
+    """
+    schedule: str
+    beta_start: float
+    beta_end: float
+    seed: Optional[int]
+    t: int
+
+
 class Diffusion:
     """
     Forward diffusion utilities for an image. Designed for UI sliders:
     - fast_diffuse(t): O(1) time per t (no iterative loop)
-    - diffuse_at_t(t): iterative semantics (matches Markov chain)
+    - diffuse_at_t(t): iterative semantics (matches Markov chain), served
+      from a checkpoint index so a seek costs at most `checkpoint_every` steps
     - frames(): generator across t steps (stream to client)
+
+    The chain is seeded per step (noise for step i comes from _mix_seed(seed, i)),
+    so frames() and diffuse_at_t() walk the very same trajectory.
     """
 
     def __init__(
         self,
-        encoded_img: str,
+        encoded_img: str | bytes,
         steps: int,
         beta_start: float,
         beta_end: float,
@@ -37,17 +83,17 @@ class Diffusion:
         *,
         seed: Optional[int] = None,
         max_side: Optional[int] = 256,
+        checkpoint_every: int = 50,
+        checkpoint_budget: int = 64 * 1024 * 1024,
+        noise: Optional[NoiseProvider] = None,
     ):
-        if not (1 <= steps <= 1000):
-            raise ValueError("steps must be in [1, 1000]")
+        if not (1 <= steps <= MAX_STEPS):
+            raise ValueError(f"steps must be in [1, {MAX_STEPS}]")
 
-        # Decode (optionally resize for safety/perf)
-        ip = ImageProcessor(encoded_img)
-        img = ip.decode_image(max_side=max_side)  # HxWx3 uint8
-        self._ip = ip  # keep for encoding helpers
-
-        # Normalize once; keep float32
-        self.x0 = (img.astype(np.float32) / 255.0).clip(0.0, 1.0)
+        # Decode (optionally resize for safety/perf), normalize once; keep float32.
+        # Cached per payload, so treat x0 as read-only.
+        self._x0_key = (payload_digest(encoded_img), max_side)
+        self.x0 = load_x0(encoded_img, max_side, key=self._x0_key)
         self.img_shape = self.x0.shape
 
         # Build schedule (precomputes all derived arrays)
@@ -59,9 +105,27 @@ class Diffusion:
         self.sqrt_alpha_bar = sched.get_all().sqrt_alpha_bar          # (T,)
         self.sqrt_one_minus_alpha_bar = sched.get_all().sqrt_one_minus_alpha_bar  # (T,)
         self.sqrt_one_minus_beta = sched.get_all().sqrt_one_minus_beta  # (T,)
+        self.sqrt_beta = sched.get_all().sqrt_beta                    # (T,)
+        self._sched = sched.get_all()
 
         # RNG: default deterministic per process; for stateless calls we derive per-t RNG
         self._base_seed = int(seed if seed is not None else np.random.SeedSequence().entropy)
+        self._noise = noise or get_noise_provider()
+        # Only closed-form draws with caller-chosen seeds are banked: one per t.
+        # A chain draws one plane per step, gigabytes per run, which would
+        # churn the bank's LRU and evict its own planes before a repeat.
+        self._persist_noise = seed is not None
+
+        # Checkpoint index over the chain: t -> x_t (float32) for t % K == 0, LRU under a byte budget
+        self.checkpoint_every = max(1, int(checkpoint_every))
+        self._checkpoints = ByteBudgetLRU(checkpoint_budget)
+
+        # Work buffers for fast_diffuse/diffuse_at_t; frames() gets its own engine
+        self._engine: Optional[FrameEngine] = None
+        self._engine_lock = threading.Lock()
+
+        # x0-side metric statistics, built on first use per downsample factor
+        self._metrics_engines: dict[int, MetricsEngine] = {}
 
         logger.info("Diffusion init: shape=%s, steps=%d, schedule=%s",
                     self.img_shape, self.steps, beta_schedule)
@@ -74,59 +138,247 @@ class Diffusion:
         O(1) time; ideal for UI slider jumping around.
         """
         t = self._clamp_t(t)
-        rng = np.random.default_rng(_mix_seed(self._base_seed, t))
-        eps = rng.normal(size=self.img_shape, loc=0.0, scale=1.0).astype(np.float32)
-        xt = self.sqrt_alpha_bar[t] * self.x0 + self.sqrt_one_minus_alpha_bar[t] * eps
-        return _uint8_from_float01(xt)
+        with self._engine_lock:
+            engine = self._shared_engine()
+            engine.draw_noise(_mix_seed(self._base_seed, t), persist=self._persist_noise)
+            engine.closed_form(self.x0, self.sqrt_alpha_bar[t], self.sqrt_one_minus_alpha_bar[t])
+            return engine.quantize(np.empty(self.img_shape, dtype=np.uint8))
+
+    @classmethod
+    def fast_diffuse_batch(
+        cls,
+        encoded_imgs: Sequence[str | bytes],
+        steps: int,
+        beta_start: float,
+        beta_end: float,
+        beta_schedule: str = "linear",
+        *,
+        t: Optional[int] = None,
+        seed: Optional[int] = None,
+        max_side: Optional[int] = 256,
+        noise: Optional[NoiseProvider] = None,
+    ) -> list[np.ndarray]:
+        """
+        fast_diffuse(t) for many images with shared settings (t defaults to T-1).
+        The schedule is built once; images are bucketed by shape and each bucket
+        is stacked into one (N,H,W,C) tensor and diffused and quantized in a
+        single vectorized pass. With a seed every image gets exactly what a
+        separate Diffusion(..., seed=seed).fast_diffuse(t) would return.
+        Results come back in input order.
+        """
+        if not (1 <= steps <= MAX_STEPS):
+            raise ValueError(f"steps must be in [1, {MAX_STEPS}]")
+        sched = BetaScheduler(steps, beta_schedule, beta_start, beta_end).get_all()
+        t = steps - 1 if t is None else int(np.clip(t, 0, steps - 1))
+        noise = noise or get_noise_provider()
+
+        x0s = [load_x0(img, max_side) for img in encoded_imgs]
+        buckets: dict[tuple, list[int]] = {}
+        for idx, x0 in enumerate(x0s):
+            buckets.setdefault(x0.shape, []).append(idx)
+
+        out: list[Optional[np.ndarray]] = [None] * len(x0s)
+        for shape, idxs in buckets.items():
+            engine = FrameEngine((len(idxs), *shape), noise=noise)
+            for k, idx in enumerate(idxs):
+                base_seed = seed if seed is not None else int(np.random.SeedSequence().entropy)
+                noise.fill(engine.eps[k], _mix_seed(base_seed, t), persist=seed is not None)
+            engine.closed_form(np.stack([x0s[i] for i in idxs]),
+                               sched.sqrt_alpha_bar[t], sched.sqrt_one_minus_alpha_bar[t])
+            frames = engine.quantize(np.empty(engine.shape, dtype=np.uint8))
+            for k, idx in enumerate(idxs):
+                out[idx] = frames[k]
+        logger.info("Batch diffusion: %d images in %d shape bucket(s), t=%d",
+                    len(x0s), len(buckets), t)
+        return out
+
+    @classmethod
+    def sweep(
+        cls,
+        encoded_img: str | bytes,
+        steps: int,
+        points: Sequence[SweepPoint],
+        *,
+        max_side: Optional[int] = 256,
+        max_chunk_bytes: int = 64 * 1024 * 1024,
+        noise: Optional[NoiseProvider] = None,
+    ) -> np.ndarray:
+        """
+        fast_diffuse(t) for every point of a (schedule, beta range, seed, t) grid
+        over one image. x0 is decoded once, each schedule is built once, and the
+        closed form is broadcast over chunks of points with per-row coefficients;
+        a chunk's float32 work buffers stay under max_chunk_bytes.
+        Returns (N,H,W,C) uint8 in point order. Seeded points match
+        Diffusion(..., seed=seed).fast_diffuse(t) exactly.
+        """
+        if not (1 <= steps <= MAX_STEPS):
+            raise ValueError(f"steps must be in [1, {MAX_STEPS}]")
+        if not points:
+            raise ValueError("points must not be empty")
+        noise = noise or get_noise_provider()
+        x0 = load_x0(encoded_img, max_side)
+
+        scheds = {}
+        for p in points:
+            key = (p.schedule, p.beta_start, p.beta_end)
+            if key not in scheds:
+                scheds[key] = BetaScheduler(steps, *key).get_all()
+
+        n = len(points)
+        per_point = 3 * x0.nbytes  # xt, eps, scratch (float32)
+        chunk = max(1, min(n, int(max_chunk_bytes) // per_point))
+        out = np.empty((n, *x0.shape), dtype=np.uint8)
+
+        engine: Optional[FrameEngine] = None
+        for lo in range(0, n, chunk):
+            part = points[lo:lo + chunk]
+            if engine is None or engine.shape[0] != len(part):
+                engine = FrameEngine((len(part), *x0.shape), noise=noise)
+            c_x = np.empty((len(part), 1, 1, 1), dtype=np.float32)
+            c_eps = np.empty_like(c_x)
+            for k, p in enumerate(part):
+                sched = scheds[(p.schedule, p.beta_start, p.beta_end)]
+                t = int(np.clip(p.t, 0, steps - 1))
+                c_x[k] = sched.sqrt_alpha_bar[t]
+                c_eps[k] = sched.sqrt_one_minus_alpha_bar[t]
+                base_seed = p.seed if p.seed is not None else int(np.random.SeedSequence().entropy)
+                noise.fill(engine.eps[k], _mix_seed(base_seed, t), persist=p.seed is not None)
+            engine.closed_form(x0, c_x, c_eps)
+            engine.quantize(out[lo:lo + len(part)])
+
+        logger.info("Sweep: %d points, %d schedule(s), chunk=%d, shape=%s",
+                    n, len(scheds), chunk, x0.shape)
+        return out
 
     def fast_diffuse_base64(
         self,
         t: int,
         *,
         format: str = "JPEG",
-        quality: int = 90,
+        quality: Optional[int] = None,
+        profile: Optional[str] = None,
         data_url: bool = False,
     ) -> str:
         arr = self.fast_diffuse(t)
         if data_url:
-            return ImageProcessor.array_to_data_url(arr, format=format, quality=quality)
-        return ImageProcessor.array_to_base64(arr, format=format, quality=quality)
+            return ImageProcessor.array_to_data_url(arr, format=format, quality=quality, profile=profile)
+        return ImageProcessor.array_to_base64(arr, format=format, quality=quality, profile=profile)
 
     def diffuse_at_t(self, t: int) -> np.ndarray:
         """
         Iterative DDPM forward process:
         x_{i+1} = sqrt(1 - beta_i) * x_i + sqrt(beta_i) * eps_i
-        Recomputes from x0 each call; use for exact chain semantics.
+        Resumes from the nearest cached checkpoint <= t (or x0), so the cost is
+        at most `checkpoint_every` steps once the index is warm. Returns exactly
+        the frame frames() streams for the same t.
         """
         t = self._clamp_t(t)
-        rng = np.random.default_rng(_mix_seed(self._base_seed, t))  # seed per-t for determinism
-        xt = self.x0
-        for i in range(t + 1):
-            eps = rng.normal(size=self.img_shape, loc=0.0, scale=1.0).astype(np.float32)
-            xt = self.sqrt_one_minus_beta[i] * xt + np.sqrt(self.beta[i], dtype=np.float32) * eps
-        return _uint8_from_float01(xt)
+        with self._engine_lock:
+            engine = self._shared_engine()
+            self._chain_state(engine, t)
+            return engine.quantize(np.empty(self.img_shape, dtype=np.uint8))
 
-    def frames(self) -> Generator[Tuple[int, np.ndarray], None, None]:
+    def strided_at_t(self, t: int, stride: int) -> np.ndarray:
+        """
+        The frame frames(stride=stride) emits for t, which must be one of
+        emitted_timesteps(stride). Like diffuse_at_t, resumes from the nearest
+        checkpoint of that strided chain, so a seek costs about
+        `checkpoint_every` steps' worth of jumps once the index is warm.
+        """
+        stride = max(1, int(stride))
+        if stride == 1:
+            return self.diffuse_at_t(t)
+        with self._engine_lock:
+            engine = self._shared_engine()
+            self._chain_state(engine, t, stride)
+            return engine.quantize(np.empty(self.img_shape, dtype=np.uint8))
+
+    def frames(
+        self,
+        stride: int = 1,
+        out_buffers: int = 1,
+        dtype: str = "uint8",
+        checkpoint: bool = False,
+    ) -> Generator[Tuple[int, float, np.ndarray], None, None]:
         """
         Stream frames for t=0..T-1 using iterative updates.
         Useful for precomputation server-side or long-poll streaming.
+
+        Frames are written into a ring of `out_buffers` reused uint8 arrays
+        (see FrameEngine): a yielded frame is only valid until that many more
+        frames were produced. Copy it, or raise out_buffers, to hold on longer.
+
+        With stride > 1 only t = 0, stride, 2*stride, ..., T-1 are produced.
+        Consecutive emitted steps t1 < t2 are joined by the exact chain jump
+        x_{t2} = sqrt(a) * x_{t1} + sqrt(1 - a) * eps,  a = alpha_bar[t2] / alpha_bar[t1]
+        so every frame keeps the distribution of the full Markov chain while
+        costing one noise draw per emitted frame instead of one per step.
+
+        dtype="float16" yields a fresh float16 copy of the unclipped state x_t
+        instead of a quantized frame (for lossless export; out_buffers unused).
+
+        checkpoint=True also fills the checkpoint index that diffuse_at_t and
+        strided_at_t seek from. Only worth it when the instance outlives the
+        run (sessions); otherwise the copies are never read.
         """
+        if dtype not in ("uint8", "float16"):
+            raise ValueError("Unsupported frame dtype. Use 'uint8' or 'float16'.")
+        if dtype == "uint8":
+            emit = FrameEngine.quantize
+        else:
+            emit = lambda engine: engine.xt.astype(np.float16)
+        stride = max(1, int(stride))
+        engine = FrameEngine(self.img_shape, n_out=out_buffers, noise=self._noise)
+        engine.reset(self.x0)
+        if stride == 1:
+            for i in range(self.steps):
+                self._chain_step(engine, i)
+                if checkpoint:
+                    self._save_checkpoint(1, i, i, engine.xt)
+                yield i, float(self.beta[i]), emit(engine)
+            return
 
-        rng = np.random.default_rng()
-        xt = self.x0
-        for i in range(self.steps):
-            eps = rng.normal(size=self.img_shape, loc=0.0, scale=1.0).astype(np.float32)
-            xt = self.sqrt_one_minus_beta[i] * xt + np.sqrt(self.beta[i], dtype=np.float32) * eps
-            print(self._compute_metrics(xt, self.x0)['Cosine'])
-            yield i, float(self.beta[i]), _uint8_from_float01(xt)
+        prev_t = -1  # x0 itself
+        for k, t in enumerate(self.emitted_timesteps(stride)):
+            self._jump(engine, prev_t, t)
+            if checkpoint:
+                self._save_checkpoint(stride, k, t, engine.xt)
+            prev_t = t
+            yield t, float(self.beta[t]), emit(engine)
 
-    def compute_metrics(self, xt: np.ndarray, xt0: np.ndarray) -> dict:
+    def emitted_timesteps(self, stride: int = 1) -> list[int]:
+        """
+        Timesteps produced by frames(stride): every stride-th step plus the last one.
+        """
+        stride = max(1, int(stride))
+        ts = list(range(0, self.steps, stride))
+        if ts[-1] != self.steps - 1:
+            ts.append(self.steps - 1)
+        return ts
+
+    def x0_stats(self) -> X0Stats:
+        stats = x0_stats_cache.get(self._x0_key)
+        if stats is None:
+            stats = X0Stats.from_x0(self.x0)
+            x0_stats_cache.put(self._x0_key, stats)
+        return stats
+
+    def expected_metrics(self) -> dict[str, np.ndarray]:
+        """
+        Expected degradation curves for all T steps in closed form
+        (see Metrics.expected_curves); no noisy image is generated.
+        """
+        return expected_curves(self._sched, self.x0_stats())
+
+    def compute_metrics(self, xt: np.ndarray, downsample: int = 1) -> dict:
         """
         Compute degradation metrics between noisy image xt and original x0.
-        xt is uint8 HxWx3
+        xt is uint8 HxWx3; see MetricsEngine for cost and the downsample error bound.
         """
-        return 0
-        
+        engine = self._metrics_engines.get(downsample)
+        if engine is None:
+            engine = self._metrics_engines.setdefault(downsample, MetricsEngine(self.x0, downsample))
+        return engine(xt)
 
     # ---------- Helpers ----------
     def _clamp_t(self, t: int) -> int:
@@ -137,7 +389,63 @@ class Diffusion:
             t = int(np.clip(t, 0, self.steps - 1))
         return int(t)
     
+    def _shared_engine(self) -> FrameEngine:
+        # Caller holds _engine_lock
+        if self._engine is None:
+            self._engine = FrameEngine(self.img_shape, noise=self._noise)
+        return self._engine
+
+    def _chain_step(self, engine: FrameEngine, i: int) -> np.ndarray:
+        engine.draw_noise(_mix_seed(self._base_seed, i))
+        return engine.step(self.sqrt_one_minus_beta[i], self.sqrt_beta[i])
+
+    def _jump(self, engine: FrameEngine, prev_t: int, t: int) -> np.ndarray:
+        # Exact chain jump from emitted step prev_t (-1: x0) to t
+        prev_alpha_bar = float(self.alpha_bar[prev_t]) if prev_t >= 0 else 1.0
+        a = float(self.alpha_bar[t]) / prev_alpha_bar
+        engine.draw_noise(_mix_seed(self._base_seed, t))
+        return engine.step(np.float32(np.sqrt(a)), np.float32(np.sqrt(max(1.0 - a, 0.0))))
+
+    def _checkpoint_interval(self, stride: int) -> int:
+        # In emitted steps: about checkpoint_every timesteps apart for any stride
+        return max(1, self.checkpoint_every // stride)
+
+    def _save_checkpoint(self, stride: int, k: int, t: int, xt: np.ndarray) -> None:
+        # k: index of t in emitted_timesteps(stride)
+        key = (stride, t)
+        if k % self._checkpoint_interval(stride) == 0 and key not in self._checkpoints:
+            cp = xt.copy()
+            cp.setflags(write=False)
+            self._checkpoints.put(key, cp)
+
+    def _chain_state(self, engine: FrameEngine, t: int, stride: int = 1) -> np.ndarray:
+        # Nearest cached checkpoint of this chain at or below t; fall back to x0
+        emitted = self.emitted_timesteps(stride)
+        k = bisect.bisect_left(emitted, t)
+        if k == len(emitted) or emitted[k] != t:
+            raise ValueError(f"t={t} is not emitted with stride {stride}")
+        K = self._checkpoint_interval(stride)
+        start, xt = -1, self.x0
+        for c in range(k - k % K, -1, -K):
+            key = (stride, emitted[c])
+            cp = self._checkpoints.get(key) if key in self._checkpoints else None
+            if cp is not None:
+                start, xt = c, cp
+                break
+        engine.reset(xt)
+        for j in range(start + 1, k + 1):
+            if stride == 1:
+                self._chain_step(engine, j)
+            else:
+                self._jump(engine, emitted[j - 1] if j > 0 else -1, emitted[j])
+            self._save_checkpoint(stride, j, emitted[j], engine.xt)
+        return engine.xt
+
+    def checkpoint_stats(self) -> dict:
+        return {"every": self.checkpoint_every, **self._checkpoints.stats()}
+
     def _compute_metrics(self, xt1: np.ndarray, xt0: np.ndarray) -> dict:
+        # float64 reference implementation; the hot path is compute_metrics()
         def _ssim_manual(x: np.ndarray, y: np.ndarray, L: int = 255) -> float:
             # Convert to float
             x = x.astype(np.float64)
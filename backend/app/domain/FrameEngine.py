@@ -0,0 +1,77 @@
+from __future__ import annotations
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.domain.Noise import NoiseProvider, get_noise_provider
+
+logger = logging.getLogger(__name__)
+
+
+class FrameEngine:
+    """
+    Preallocated work buffers for the forward-diffusion hot loop.
+
+    Holds the float32 state x_t, a float32 noise buffer, a float32 scratch
+    buffer and a ring of `n_out` uint8 output buffers. Noise is drawn
+    directly as float32 into the noise buffer, and the update and the
+    quantization run in place, so steady-state steps allocate no image-sized
+    arrays. quantize() hands out the ring buffers in turn: a returned frame
+    stays valid until `n_out` further frames have been quantized.
+    Not thread-safe; use one engine per concurrent consumer.
+    """
+
+    def __init__(
+        self,
+        shape: Tuple[int, ...],
+        n_out: int = 1,
+        noise: Optional[NoiseProvider] = None,
+    ):
+        self.shape = tuple(shape)
+        self.noise = noise or get_noise_provider()
+        self.xt = np.empty(self.shape, dtype=np.float32)
+        self.eps = np.empty(self.shape, dtype=np.float32)
+        self._scratch = np.empty(self.shape, dtype=np.float32)
+        self._out = [np.empty(self.shape, dtype=np.uint8) for _ in range(max(1, int(n_out)))]
+        self._next_out = 0
+
+    def reset(self, x: np.ndarray) -> None:
+        np.copyto(self.xt, x)
+
+    def draw_noise(self, seed: int, persist: bool = False) -> np.ndarray:
+        # persist=True lets the provider's noise bank serve or keep the plane
+        return self.noise.fill(self.eps, seed, persist=persist)
+
+    def step(self, c_x: np.float32, c_eps: np.float32) -> np.ndarray:
+        """
+        xt <- c_x * xt + c_eps * eps, in place (clobbers eps).
+        """
+        self.xt *= c_x
+        self.eps *= c_eps
+        self.xt += self.eps
+        return self.xt
+
+    def closed_form(self, x0: np.ndarray, c_x: np.float32, c_eps: np.float32) -> np.ndarray:
+        """
+        xt <- c_x * x0 + c_eps * eps, in place (clobbers eps).
+        """
+        np.multiply(x0, c_x, out=self.xt)
+        self.eps *= c_eps
+        self.xt += self.eps
+        return self.xt
+
+    def quantize(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        uint8 frame of clip(xt, 0, 1) * 255 rounded; same values as the
+        allocating _uint8_from_float01. Uses the next ring buffer unless `out` is given.
+        """
+        if out is None:
+            out = self._out[self._next_out]
+            self._next_out = (self._next_out + 1) % len(self._out)
+        s = self._scratch
+        np.clip(self.xt, 0.0, 1.0, out=s)
+        s *= np.float32(255.0)
+        s += np.float32(0.5)
+        np.copyto(out, s, casting="unsafe")  # truncates like astype(np.uint8)
+        return out
@@ -1,12 +1,14 @@
 from __future__ import annotations
 import base64
+import hashlib
 import logging
+import threading
 from dataclasses import dataclass
 from io import BytesIO
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageFile
 
 logger = logging.getLogger(__name__)
 
@@ -18,23 +20,157 @@ def _strip_data_url_prefix(b64: str) -> str:
     return b64
 
 
+def mime_for(format: str) -> str:
+    return {
+        "JPEG": "image/jpeg",
+        "JPG": "image/jpeg",
+        "PNG": "image/png",
+        "WEBP": "image/webp",
+    }.get(format.upper(), "application/octet-stream")
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """
+    One speed/size trade-off for still-image encodes. The output format is
+    picked separately (JPEG or WebP); each format reads its own half.
+    """
+    name: str
+    jpeg_quality: int
+    subsampling: int       # JPEG chroma: 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+    optimize: bool         # JPEG: extra pass for optimal Huffman tables
+    progressive: bool
+    webp_quality: int      # lossless: compression effort instead of fidelity
+    webp_method: int       # 0 = fastest .. 6 = smallest
+    webp_lossless: bool = False
+
+    def save_kwargs(self, format: str, quality: Optional[int] = None) -> dict:
+        """
+        Pillow save() options for `format`; `quality` overrides the profile's.
+        """
+        fmt = format.upper()
+        if fmt in ("JPEG", "JPG"):
+            return {
+                "quality": int(quality if quality is not None else self.jpeg_quality),
+                "subsampling": self.subsampling,
+                "optimize": self.optimize,
+                "progressive": self.progressive,
+            }
+        if fmt == "WEBP":
+            return {
+                "quality": int(quality if quality is not None else self.webp_quality),
+                "method": self.webp_method,
+                "lossless": self.webp_lossless,
+            }
+        return {}
+
+
+ENCODER_PROFILES: Dict[str, EncoderProfile] = {
+    # Live previews: cheapest encode, bytes be damned
+    "fast-preview": EncoderProfile(
+        "fast-preview", jpeg_quality=70, subsampling=2, optimize=False, progressive=False,
+        webp_quality=70, webp_method=0,
+    ),
+    "balanced": EncoderProfile(
+        "balanced", jpeg_quality=85, subsampling=2, optimize=True, progressive=False,
+        webp_quality=80, webp_method=4,
+    ),
+    # Downloads: full chroma / lossless. Lossless effort past 30/method 2 costs
+    # several times the CPU for no measurable size gain on diffusion frames.
+    "archival": EncoderProfile(
+        "archival", jpeg_quality=95, subsampling=0, optimize=True, progressive=True,
+        webp_quality=30, webp_method=2, webp_lossless=True,
+    ),
+}
+
+DEFAULT_PROFILE = "balanced"
+
+
+def get_profile(profile: Union[str, EncoderProfile, None]) -> EncoderProfile:
+    if isinstance(profile, EncoderProfile):
+        return profile
+    try:
+        return ENCODER_PROFILES[profile or DEFAULT_PROFILE]
+    except KeyError:
+        raise ValueError(f"unknown encoder profile {profile!r}; expected one of {sorted(ENCODER_PROFILES)}")
+
+
+_maxblock_lock = threading.Lock()
+
+
+def _reserve_jpeg_buffer(size: Tuple[int, int]) -> None:
+    # libjpeg's optimize/progressive modes write the whole file into one buffer
+    # that Pillow sizes at 1-2 bytes/px, floored at ImageFile.MAXBLOCK; noisy
+    # frames at high quality with 4:4:4 chroma need up to ~3. Only ever raised.
+    need = 3 * size[0] * size[1] + 65536
+    if ImageFile.MAXBLOCK < need:
+        with _maxblock_lock:
+            ImageFile.MAXBLOCK = max(ImageFile.MAXBLOCK, need)
+
+
+def _target_size(size: Tuple[int, int], max_side: Optional[int]) -> Optional[Tuple[int, int]]:
+    # (w, h) after fitting the longest side into max_side, or None if no resize is needed
+    if max_side is None or max_side <= 0:
+        return None
+    w, h = size
+    m = max(w, h)
+    if m <= max_side:
+        return None
+    scale = max_side / float(m)
+    return (max(int(w * scale), 1), max(int(h * scale), 1))
+
+
+def payload_digest(encoded_img: str | bytes) -> str:
+    """
+    Content hash of an encoded image payload. Data URL and raw base64 forms
+    of the same image hash identically; no base64 decoding is performed.
+    Raw file bytes are hashed as-is.
+    """
+    if isinstance(encoded_img, bytes):
+        return hashlib.blake2b(encoded_img, digest_size=16).hexdigest()
+    body = _strip_data_url_prefix(encoded_img).strip()
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+
 @dataclass
 class ImageProcessor:
     """
     Small utility for decoding/encoding base64 images and basic validation.
+    encoded_img may also be the raw file bytes (e.g. a stored upload).
     """
-    encoded_img: str
+    encoded_img: str | bytes
     _decoded_image: Optional[np.ndarray] = None  # HxWxC uint8
+    decode_path: Optional[str] = None  # "full" or "draft" once decoded
 
     # ---------- Decode ----------
-    def _decode_image(self, encoded_img: str) -> np.ndarray:
+    def _decode_image(
+        self,
+        encoded_img: str | bytes,
+        max_side: Optional[int] = None,
+        fast: bool = True,
+    ) -> np.ndarray:
         try:
-            raw = base64.b64decode(_strip_data_url_prefix(encoded_img), validate=True)
+            if isinstance(encoded_img, bytes):
+                raw = encoded_img
+            else:
+                raw = base64.b64decode(_strip_data_url_prefix(encoded_img), validate=True)
             with Image.open(BytesIO(raw)) as im:
+                # Only the header has been read so far; size is known before decoding.
+                new_size = _target_size(im.size, max_side)
+                self.decode_path = "full"
+                if fast and new_size is not None and im.format == "JPEG":
+                    # Let libjpeg downscale in the DCT domain (1/2, 1/4, 1/8) to the
+                    # smallest size still >= target, so we never hold the full raster.
+                    full_size = im.size
+                    im.draft("RGB", new_size)
+                    if im.size != full_size:
+                        self.decode_path = "draft"
                 # Normalize to RGB to keep the rest of the pipeline simple.
                 im = im.convert("RGB")
+                if new_size is not None and im.size != new_size:
+                    im = im.resize(new_size, resample=Image.LANCZOS)
                 arr = np.asarray(im, dtype=np.uint8)
-            logger.debug("Image decoded: shape=%s, dtype=%s", arr.shape, arr.dtype)
+            logger.debug("Image decoded (%s): shape=%s, dtype=%s", self.decode_path, arr.shape, arr.dtype)
             return arr
         except Exception as e:
             logger.error("Image decoding failed: %s", e)
@@ -44,21 +180,14 @@ class ImageProcessor:
         self,
         *,
         max_side: Optional[int] = None,
+        fast: bool = True,
     ) -> np.ndarray:
         """
         Decode to HxWx3 uint8; optionally downscale preserving aspect ratio.
+        With fast=True large JPEGs are reduced by the codec while decoding
+        before the final LANCZOS resample; see decode_path for the path taken.
         """
-        img = self._decode_image(self.encoded_img)
-        if max_side is not None and max_side > 0:
-            h, w = img.shape[:2]
-            m = max(h, w)
-            if m > max_side:
-                scale = max_side / float(m)
-                new_size = (max(int(w * scale), 1), max(int(h * scale), 1))
-                with Image.fromarray(img) as im:
-                    im = im.resize(new_size, resample=Image.LANCZOS)
-                    img = np.asarray(im, dtype=np.uint8)
-                logger.debug("Image resized to: %s", img.shape)
+        img = self._decode_image(self.encoded_img, max_side=max_side, fast=fast)
         self._decoded_image = img
         return img
 
@@ -71,13 +200,16 @@ class ImageProcessor:
 
     # ---------- Encode helpers (useful for API responses) ----------
     @staticmethod
-    def array_to_base64(
+    def array_to_bytes(
         arr: np.ndarray,
         format: str = "JPEG",
-        quality: int = 90,
-    ) -> str:
+        quality: Optional[int] = None,
+        profile: Union[str, EncoderProfile, None] = None,
+    ) -> bytes:
         """
-        Encode an HxWx{1,3} uint8 numpy array to raw base64 (no data URL prefix).
+        Encode an HxWx{1,3} uint8 numpy array to raw encoded image bytes.
+        Codec settings come from the encoder profile (default "balanced");
+        an explicit quality overrides the profile's.
         """
         if arr.ndim == 2:
             mode = "L"
@@ -91,28 +223,59 @@ class ImageProcessor:
         else:
             raise ValueError("Expected HxW or HxWx{1,3} uint8 array.")
         buff = BytesIO()
-        save_kwargs = {}
-        if format.upper() == "JPEG":
-            save_kwargs["quality"] = int(quality)
-            save_kwargs["optimize"] = True
-        pil.save(buff, format=format)
-        return base64.b64encode(buff.getvalue()).decode("utf-8")
+        save_kwargs = get_profile(profile).save_kwargs(format, quality)
+        if save_kwargs.get("optimize") or save_kwargs.get("progressive"):
+            _reserve_jpeg_buffer(pil.size)
+        pil.save(buff, format=format, **save_kwargs)
+        return buff.getvalue()
+
+    @staticmethod
+    def array_to_base64(
+        arr: np.ndarray,
+        format: str = "JPEG",
+        quality: Optional[int] = None,
+        profile: Union[str, EncoderProfile, None] = None,
+    ) -> str:
+        """
+        Encode an HxWx{1,3} uint8 numpy array to raw base64 (no data URL prefix).
+        """
+        raw = ImageProcessor.array_to_bytes(arr, format=format, quality=quality, profile=profile)
+        return base64.b64encode(raw).decode("utf-8")
 
     @staticmethod
     def array_to_data_url(
         arr: np.ndarray,
         format: str = "JPEG",
-        quality: int = 90,
+        quality: Optional[int] = None,
+        profile: Union[str, EncoderProfile, None] = None,
     ) -> str:
-        mime = {
-            "JPEG": "image/jpeg",
-            "JPG": "image/jpeg",
-            "PNG": "image/png",
-            "WEBP": "image/webp",
-        }.get(format.upper(), "application/octet-stream")
-        b64 = ImageProcessor.array_to_base64(arr, format=format, quality=quality)
+        mime = mime_for(format)
+        b64 = ImageProcessor.array_to_base64(arr, format=format, quality=quality, profile=profile)
         return f"data:{mime};base64,{b64}"
 
+    @staticmethod
+    def contact_sheet(
+        frames: np.ndarray,
+        cols: int,
+        pad: int = 2,
+        background: int = 255,
+    ) -> np.ndarray:
+        """
+        Tile (N,H,W,C) uint8 frames row-major into one grid image with `pad` px gutters.
+        """
+        n, h, w = frames.shape[:3]
+        cols = max(1, min(int(cols), n))
+        rows = -(-n // cols)
+        sheet = np.full(
+            (rows * h + (rows - 1) * pad, cols * w + (cols - 1) * pad, *frames.shape[3:]),
+            background, dtype=np.uint8,
+        )
+        for i in range(n):
+            r, c = divmod(i, cols)
+            y, x = r * (h + pad), c * (w + pad)
+            sheet[y:y + h, x:x + w] = frames[i]
+        return sheet
+
 def main():
     import matplotlib.pyplot as plt
     import base64
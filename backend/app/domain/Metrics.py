@@ -0,0 +1,122 @@
+from __future__ import annotations
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+from app.domain.BetaScheduler import BetaScheduleResult
+
+logger = logging.getLogger(__name__)
+
+# SSIM stabilizers for data range L = 1 (equivalent to L = 255 on uint8 values)
+_C1 = 0.01 ** 2
+_C2 = 0.03 ** 2
+
+
+@dataclass(frozen=True)
+class X0Stats:
+    """
+    Global statistics of a normalized x0 (values in [0, 1]).
+    """
+    n: int          # number of values (H * W * C)
+    mean: float     # E[x0]
+    var: float      # Var[x0]
+    mean_sq: float  # E[x0^2]
+
+    @classmethod
+    def from_x0(cls, x0: np.ndarray) -> X0Stats:
+        x = x0.astype(np.float64, copy=False).ravel()
+        mean = float(x.mean())
+        mean_sq = float(np.dot(x, x) / x.size)
+        return cls(n=int(x.size), mean=mean, var=max(mean_sq - mean * mean, 0.0), mean_sq=mean_sq)
+
+
+def expected_curves(sched: BetaScheduleResult, stats: X0Stats) -> dict[str, np.ndarray]:
+    """
+    Closed-form per-step curves for x_t = a * x0 + b * eps, with
+    a = sqrt(alpha_bar[t]), b = sqrt(1 - alpha_bar[t]), eps ~ N(0, I).
+
+    Values are large-N expectations for the *unclipped* x_t; sampled frames
+    are clipped to [0, 1] and quantized, so they drift from these curves once
+    noise dominates (roughly where std exceeds ~0.3).
+    Returns (T,) float64 arrays: cosine, psnr (dB, data range 1),
+    snr_db, ssim (global, same formula as the sampled metric), mean, std.
+    """
+    a = sched.sqrt_alpha_bar.astype(np.float64)
+    b2 = np.maximum(1.0 - sched.alpha_bar.astype(np.float64), 1e-12)
+
+    mu, var, m2 = stats.mean, stats.var, stats.mean_sq
+
+    # Per-element second moments: <x0, xt>/N = a*m2, |xt|^2/N = a^2*m2 + b^2
+    cosine = (a * m2) / np.sqrt(m2 * (a * a * m2 + b2)) if m2 > 0 else np.zeros_like(a)
+
+    mse = (a - 1.0) ** 2 * m2 + b2
+    psnr = 10.0 * np.log10(1.0 / mse)
+    snr_db = 10.0 * np.log10(np.maximum(a * a * m2, 1e-12) / b2)
+
+    mean_t = a * mu
+    var_t = a * a * var + b2
+    cov = a * var
+    ssim = ((2.0 * mu * mean_t + _C1) * (2.0 * cov + _C2)) / \
+        ((mu * mu + mean_t * mean_t + _C1) * (var + var_t + _C2))
+
+    return {
+        "cosine": cosine,
+        "psnr": psnr,
+        "snr_db": snr_db,
+        "ssim": ssim,
+        "mean": mean_t,
+        "std": np.sqrt(var_t),
+    }
+
+
+class MetricsEngine:
+    """
+    Sampled SSIM / cosine between x0 and emitted uint8 frames.
+
+    x0 is quantized to uint8 once (same reference the old per-frame path
+    rebuilt every time) and its mean, variance, norm and centered copy are
+    precomputed, so a frame costs one float32 cast and three dot products.
+
+    Working in float32 changes results by < 5e-4 absolute vs the float64
+    reference. downsample=s evaluates on every s-th row/column only; the
+    results are then sample estimates over N/s^2 pixels and the absolute
+    error stays below 1e-2 for s=2 and 2e-2 for s=4 at 256-1024 px; it is
+    largest on small images (~8e-3 at 256 px, s=2). benchmarks/bench_metrics.py
+    prints the max error it measures.
+    """
+
+    def __init__(self, x0: np.ndarray, downsample: int = 1):
+        self.downsample = max(1, int(downsample))
+        ref = np.clip(x0 * 255.0 + 0.5, 0.0, 255.0).astype(np.uint8)
+        x = self._sample(ref).astype(np.float32).ravel()
+        self._n = x.size
+        self._mu_x = float(x.mean(dtype=np.float64))
+        self._var_x = float(x.var(dtype=np.float64))
+        self._x = x
+        self._x_centered = x - np.float32(self._mu_x)
+        self._xc_mean = float(self._x_centered.mean(dtype=np.float64))  # ~0, float32 rounding
+        self._norm_x = float(np.sqrt(np.dot(x, x)))
+
+    def __call__(self, frame: np.ndarray, L: int = 255) -> dict:
+        y = self._sample(frame).astype(np.float32).ravel()
+        n = self._n
+        mu_y = float(y.mean(dtype=np.float64))
+        yy = float(np.dot(y, y))
+        var_y = max(yy / n - mu_y * mu_y, 0.0)
+        # sum(x - mu_x) ~= 0, so cov = <x - mu_x, y> / N (minus the rounding residue)
+        sigma_xy = float(np.dot(self._x_centered, y)) / n - self._xc_mean * mu_y
+        norm_y = float(np.sqrt(yy))
+
+        C1 = (0.01 * L) ** 2
+        C2 = (0.03 * L) ** 2
+        mu_x, var_x = self._mu_x, self._var_x
+        ssim = ((2 * mu_x * mu_y + C1) * (2 * sigma_xy + C2)) / \
+            ((mu_x ** 2 + mu_y ** 2 + C1) * (var_x + var_y + C2))
+        denom = self._norm_x * norm_y
+        cosine = float(np.dot(self._x, y)) / denom if denom > 0 else 0.0
+        return {"SSIM": ssim, "Cosine": cosine}
+
+    def _sample(self, arr: np.ndarray) -> np.ndarray:
+        s = self.downsample
+        return arr if s == 1 else arr[::s, ::s]
@@ -0,0 +1,245 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _fill_standard_normal(seed_seq: np.random.SeedSequence, out: np.ndarray) -> None:
+    # Generator.standard_normal releases the GIL while filling `out`
+    np.random.Generator(np.random.PCG64(seed_seq)).standard_normal(dtype=np.float32, out=out)
+
+
+class NoiseBank:
+    """
+    Persistent, size-capped store of noise planes on local disk.
+
+    One .npy file per (seed, shape) under a directory namespaced by the
+    provider fingerprint and storage dtype. The seed is the per-t seed from
+    _mix_seed, which already encodes (seed, t). Planes are filled lazily,
+    written atomically (temp file + os.replace) and read back with
+    np.load(mmap_mode="r"), so every uvicorn worker on the host shares them
+    read-only through the page cache. Once the directory exceeds max_bytes
+    the least recently used planes (by mtime, refreshed on hit) are deleted.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        dtype: Literal["float16", "float32"] = "float32",
+    ):
+        if dtype not in ("float16", "float32"):
+            raise ValueError("Unsupported noise bank dtype. Use 'float16' or 'float32'.")
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._bytes = self._scan_bytes()
+
+    def load(self, namespace: str, seed: int, shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+        path = self._path(namespace, seed, shape)
+        try:
+            plane = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        if plane.shape != tuple(shape) or plane.dtype != self.dtype:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(path)  # LRU recency for eviction
+        except OSError:
+            pass
+        return plane
+
+    def store(self, namespace: str, seed: int, plane: np.ndarray) -> None:
+        path = self._path(namespace, seed, plane.shape)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, plane.astype(self.dtype, copy=False))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Noise bank write failed (%s): %s", path, e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._bytes += os.path.getsize(path)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "root": self.root,
+            "dtype": self.dtype.name,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    # ---------- Internals ----------
+    def _path(self, namespace: str, seed: int, shape: Tuple[int, ...]) -> str:
+        dims = "x".join(str(int(d)) for d in shape)
+        return os.path.join(self.root, f"{namespace}-{self.dtype.name}", dims, f"{seed & 0xFFFFFFFF:08x}.npy")
+
+    def _files(self) -> list[tuple[float, int, str]]:
+        out = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # removed by another worker
+                out.append((st.st_mtime, st.st_size, path))
+        return out
+
+    def _scan_bytes(self) -> int:
+        return sum(size for _, size, _ in self._files())
+
+    def _evict(self) -> None:
+        # Caller holds the lock. Rescan: other workers share the directory.
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)  # leave headroom so we don't rescan on every store
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)  # open memmaps elsewhere stay valid on POSIX
+                self.evictions += 1
+            except OSError:
+                pass
+            total -= size
+        self._bytes = total
+
+
+class NoiseProvider:
+    """
+    Fills float32 buffers with N(0, 1) noise for a seed, optionally across threads.
+
+    With threads > 1 the flattened buffer is cut into
+    n = min(threads, size // min_chunk) contiguous chunks and chunk k is drawn
+    from SeedSequence(seed).spawn(n)[k], each by its own worker. The result
+    depends only on (seed, threads, size), never on scheduling. When n would
+    be 1 (buffers under 2 * min_chunk values, or threads == 1) the plain
+    default_rng(seed) stream is used, so per-t seeds from _mix_seed work
+    unchanged.
+
+    With a NoiseBank attached, persisted draws (persist=True) are served from
+    the bank when present. With a float16 bank, fresh draws are rounded to
+    float16 before use, so a seed maps to the same noise whether or not it
+    came from the bank.
+    """
+
+    def __init__(
+        self,
+        threads: int = 1,
+        min_chunk: int = 1 << 16,
+        bank: Optional[NoiseBank] = None,
+    ):
+        if threads < 1:
+            raise ValueError("threads must be >= 1")
+        self.threads = int(threads)
+        self.min_chunk = int(min_chunk)
+        self.bank = bank
+        # The calling thread fills the first chunk itself
+        self._pool: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(self.threads - 1, thread_name_prefix="noise")
+            if self.threads > 1 else None
+        )
+
+    def fill(self, out: np.ndarray, seed: int, persist: bool = False) -> np.ndarray:
+        """
+        Fill `out` with noise for `seed`. persist=True lets the bank (if any)
+        serve or keep the plane; use it only for caller-chosen, reusable seeds.
+        """
+        if out.dtype != np.float32 or not out.flags.c_contiguous:
+            raise ValueError("out must be a C-contiguous float32 array")
+        if persist and self.bank is not None:
+            namespace = self._generator_fingerprint()
+            plane = self.bank.load(namespace, seed, out.shape)
+            if plane is not None:
+                np.copyto(out, plane)
+                return out
+            self._generate(out, seed)
+            if self.bank.dtype != np.float32:
+                np.copyto(out, out.astype(self.bank.dtype))
+            self.bank.store(namespace, seed, out)
+            return out
+        return self._generate(out, seed)
+
+    def _generate(self, out: np.ndarray, seed: int) -> np.ndarray:
+        flat = out.reshape(-1)
+        n = min(self.threads, max(1, flat.size // self.min_chunk))
+        if self._pool is None or n == 1:
+            np.random.default_rng(seed).standard_normal(dtype=np.float32, out=out)
+            return out
+
+        children = np.random.SeedSequence(seed).spawn(n)
+        chunks = np.array_split(flat, n)
+        futures = [
+            self._pool.submit(_fill_standard_normal, child, chunk)
+            for child, chunk in zip(children[1:], chunks[1:])
+        ]
+        _fill_standard_normal(children[0], chunks[0])
+        for f in futures:
+            f.result()
+        return out
+
+    def fingerprint(self) -> str:
+        """
+        Identifies the noise a seed maps to (differs when thread count or bank dtype changes it).
+        """
+        if self.bank is not None and self.bank.dtype != np.float32:
+            return f"{self._generator_fingerprint()}-{self.bank.dtype.name}"
+        return self._generator_fingerprint()
+
+    def _generator_fingerprint(self) -> str:
+        return f"pcg64-f32-t{self.threads}-c{self.min_chunk}"
+
+    def stats(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint(),
+            "threads": self.threads,
+            **({"bank": self.bank.stats()} if self.bank is not None else {}),
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+_default_provider = NoiseProvider()
+
+
+def get_noise_provider() -> NoiseProvider:
+    return _default_provider
+
+
+def set_noise_provider(provider: NoiseProvider) -> None:
+    global _default_provider
+    logger.info("Noise provider: %s", provider.fingerprint())
+    _default_provider = provider
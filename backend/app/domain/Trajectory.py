@@ -0,0 +1,78 @@
+from __future__ import annotations
+import logging
+import zipfile
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def npy_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    """
+    .npy header for a C-ordered array; the raw array bytes follow it directly.
+    """
+    buff = BytesIO()
+    np.lib.format.write_array_header_1_0(buff, {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": tuple(int(d) for d in shape),
+    })
+    return buff.getvalue()
+
+
+class _Sink:
+    # Write-only, unseekable: zipfile falls back to streaming mode (data descriptors)
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class NpzStream:
+    """
+    Incremental .npz (zip of .npy members) writer. After any call, take()
+    returns the archive bytes produced so far, so the archive can be sent
+    while it is written without ever holding a whole member.
+    """
+
+    def __init__(self, compress: bool = False):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(
+            self._sink, "w",
+            compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+            allowZip64=True,
+        )
+        self._member: Optional[zipfile.ZipExtFile] = None
+
+    def add_array(self, name: str, arr: np.ndarray) -> None:
+        with self._zip.open(f"{name}.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(arr))
+
+    def begin(self, name: str, dtype: np.dtype, shape: Tuple[int, ...]) -> None:
+        self._member = self._zip.open(f"{name}.npy", "w", force_zip64=True)
+        self._member.write(npy_header(dtype, shape))
+
+    def write(self, data: bytes) -> None:
+        self._member.write(data)
+
+    def end(self) -> None:
+        self._member.close()
+        self._member = None
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def take(self) -> bytes:
+        return self._sink.take()
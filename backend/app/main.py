@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from app.core.cors import add_cors
 from app.core.config import settings
+from app.core.executor import shutdown_executor
 from app.routers import auth
 from app.db.session import engine
 from sqlalchemy import text
@@ -41,4 +42,5 @@ async def test_connection():
 @app.on_event("shutdown")
 async def shutdown_event():
     print("🛑 App is shutting down...")
+    shutdown_executor()
     # close DB, release resources, etc.
\ No newline at end of file
@@ -1,8 +1,41 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from app.schemas.diffusion import DiffuseRequest, DiffuseResponse, WSStartPayload
-from app.services.diffusion_service import DiffusionService, DiffuseWSService, get_last_beta_array
-from typing import Optional
-import asyncio, json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse
+from app.schemas.diffusion import (
+    CurvesRequest,
+    CurvesResponse,
+    DiffuseBatchRequest,
+    DiffuseBatchResponse,
+    DiffuseRawParams,
+    DiffuseRequest,
+    DiffuseResponse,
+    ExportParams,
+    ScheduleResponse,
+    SessionCreateRequest,
+    SessionResponse,
+    StreamParams,
+    SweepRequest,
+    SweepResponse,
+    TrajectoryParams,
+    WSStartPayload,
+)
+from app.domain.BetaScheduler import get_schedule
+from app.services.diffusion_service import (
+    DiffusionService,
+    DiffuseWSService,
+    RenderedResponse,
+    ScheduleService,
+    SessionService,
+    StreamService,
+    get_noise_stats,
+    get_response_cache_stats,
+    get_session_stats,
+    get_ws_stats,
+)
+from app.services.session_store import ExportBudgetError, SessionClosedError
+from app.core.executor import get_executor
+from app.domain.Diffusion import x0_cache
+from typing import Literal, Optional
+import asyncio, json, os
 
 
 
@@ -10,23 +43,235 @@ router = APIRouter(prefix="", tags=["diffusion"])
 
 
 @router.post("/diffuse", response_model=DiffuseResponse)
-async def diffuse(req: DiffuseRequest):
+async def diffuse(req: DiffuseRequest, request: Request):
     """
-    Accepts base64/data-URL image + diffusion params and returns the diffused image.
+    Accepts a base64/data-URL image (or the id of a stored image) + diffusion
+    params and returns the diffused image. Seeded results carry a strong ETag;
+    sending it back in If-None-Match answers 304 (see _rendered_response).
     """
-    print("herte")
+    image = await DiffusionService.resolve_image(req, request)
     try:
-        return DiffusionService.run_diffusion(req)
+        rendered = await DiffusionService.render(req, image)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Diffusion failed: {e}")
+    return _rendered_response(request, rendered)
 
-@router.get("/schedule")
-async def schedule():
-    array = get_last_beta_array()
-    if array:
-        return array
+@router.post("/diffuse/raw", response_class=Response)
+async def diffuse_raw(request: Request, params: DiffuseRawParams = Depends()):
+    """
+    Binary variant of /diffuse: the body is the image file (application/octet-stream,
+    or multipart/form-data with a "file" field), parameters go in the query string,
+    and the response is the encoded image with metadata in X-Diffusion-* headers.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a 'file' field")
+        image = await upload.read()
     else:
-        raise HTTPException(status_code=400, detail="Please run diffusion to generate")
+        image = await request.body()
+    if not image:
+        raise HTTPException(status_code=400, detail="Empty image body")
+    try:
+        rendered = await DiffusionService.render(params, image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Diffusion failed: {e}")
+    return _rendered_response(request, rendered)
+
+def _rendered_response(request: Request, rendered: RenderedResponse) -> Response:
+    # Deliberately non-standard: RFC 9110 wants 412 for a matching If-None-Match
+    # on POST. /diffuse and /diffuse/raw are pure computations sent as POST only
+    # because of their bodies, so clients revalidate a seeded result by echoing
+    # its ETag and get 304 instead of the image again. "*" is not honoured: it
+    # would skip the work without naming a result the client actually holds.
+    etag = rendered.headers.get("ETag")
+    if etag and _etag_matches(request.headers.get("if-none-match"), etag, wildcard=False):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=rendered.body, media_type=rendered.media_type, headers=rendered.headers)
+
+@router.post("/diffuse/sessions", response_model=SessionResponse, status_code=201)
+async def create_session(req: SessionCreateRequest, request: Request):
+    """
+    Keeps x0, the schedule and the seed server-side so any frame can be fetched
+    by t (GET /diffuse/sessions/{id}/frames/{t}) until the session idles out.
+    """
+    image = await DiffusionService.resolve_image(req, request)
+    try:
+        return await SessionService.create(req, image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Session creation failed: {e}")
+
+@router.get("/diffuse/sessions/{session_id}/frames/{t}", response_class=Response)
+async def session_frame(session_id: str, t: int, request: Request):
+    # A (session, t) frame never changes, so the ETag needs no content hash
+    etag = f'"{session_id}-{t}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600, immutable", "X-Diffusion-T": str(t)}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    data, media_type = await SessionService.frame(session_id, t)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+_STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@router.get("/diffuse/sessions/{session_id}/stream")
+async def session_stream(session_id: str, params: StreamParams = Depends()):
+    """
+    MJPEG-style multipart/x-mixed-replace stream of the session's chain;
+    point an <img src> at it. No base64 or JSON per frame.
+    """
+    session = StreamService.session(session_id)
+    return StreamingResponse(
+        StreamService.mjpeg(session, params),
+        media_type=f"multipart/x-mixed-replace; boundary={StreamService.BOUNDARY}",
+        headers=_STREAM_HEADERS,
+    )
+
+@router.get("/diffuse/sessions/{session_id}/events")
+async def session_events(session_id: str, params: StreamParams = Depends()):
+    """
+    Server-sent events with per-step metadata (t, beta, progress, metrics). When
+    preview_every matches the session's, each event also carries the URL of
+    its frame, which is cached in the session by the time the event is sent.
+    """
+    session = StreamService.session(session_id)
+    return StreamingResponse(
+        StreamService.events(session, params),
+        media_type="text/event-stream",
+        headers=_STREAM_HEADERS,
+    )
+
+@router.get("/diffuse/sessions/{session_id}/export")
+async def session_export(session_id: str, params: ExportParams = Depends()):
+    """
+    The session's chain trajectory as one animated WebP or GIF download.
+    GIF parts are streamed as they are encoded; WebP is sent once assembled.
+    """
+    session = StreamService.session(session_id)
+    filename = f"diffusion-{session.inst.steps}steps.{params.format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if params.format == "gif":
+        return StreamingResponse(StreamService.gif(session, params), media_type="image/gif", headers=headers)
+    try:
+        data = await StreamService.webp(session, params)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Export failed: {e}")
+    return Response(content=data, media_type="image/webp", headers=headers)
+
+@router.get("/diffuse/sessions/{session_id}/trajectory")
+async def session_trajectory(session_id: str, params: TrajectoryParams = Depends()):
+    """
+    The session's chain trajectory as a lossless (N, H, W, C) array for
+    np.load: .npy or .npz streamed while the chain runs, or (file=true) a
+    server-side .npy served with HTTP Range support.
+    """
+    if params.file and params.format != "npy":
+        raise HTTPException(status_code=400, detail="file=true is only available for format=npy")
+    session = StreamService.session(session_id)
+    filename = f"trajectory-{session.inst.steps}steps-{params.dtype}.{params.format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if params.file:
+        try:
+            path = await StreamService.npy_file(session, params)
+        except ExportBudgetError as e:
+            raise HTTPException(status_code=507, detail=f"Export failed: {e}")
+        except SessionClosedError:
+            raise HTTPException(status_code=410, detail="Session closed during export")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Export failed: {e}")
+        if not os.path.exists(path):
+            # The session closed (or replaced its file) since the export finished
+            raise HTTPException(status_code=410, detail="Export file is gone")
+        return FileResponse(path, media_type="application/octet-stream", filename=filename)
+    if params.format == "npz":
+        return StreamingResponse(StreamService.npz(session, params), media_type="application/zip", headers=headers)
+    headers["Content-Length"] = str(StreamService.npy_length(session, params))
+    return StreamingResponse(StreamService.npy(session, params), media_type="application/octet-stream", headers=headers)
+
+@router.delete("/diffuse/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    if not SessionService.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return Response(status_code=204)
+
+@router.post("/diffuse/batch", response_model=DiffuseBatchResponse)
+async def diffuse_batch(req: DiffuseBatchRequest):
+    """
+    Diffuses many images with the same settings in one vectorized pass.
+    """
+    try:
+        return await DiffusionService.run_batch(req)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Batch diffusion failed: {e}")
+
+@router.post("/diffuse/sweep", response_model=SweepResponse)
+async def diffuse_sweep(req: SweepRequest):
+    """
+    Diffuses one image over a grid of schedules, beta ranges, seeds and timesteps.
+    """
+    try:
+        return await DiffusionService.run_sweep(req)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Sweep failed: {e}")
+
+@router.post("/diffuse/curves", response_model=CurvesResponse)
+async def diffuse_curves(req: CurvesRequest):
+    """
+    Expected cosine/PSNR/SNR/SSIM and pixel mean/std for every timestep,
+    computed in closed form from the schedule and x0 statistics.
+    """
+    try:
+        return await DiffusionService.expected_curves(req)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Curve computation failed: {e}")
+
+@router.get("/diffuse/stats")
+async def diffuse_stats():
+    """
+    Per-stage timings of the compute executor (queue wait and run time)
+    and hit/miss counters of the decoded-image cache and noise bank, plus
+    /diffuse/ws emitted/dropped preview counts.
+    """
+    return {
+        "executor": get_executor().stats(),
+        "x0_cache": x0_cache.stats(),
+        "responses": get_response_cache_stats(),
+        "sessions": get_session_stats(),
+        "ws": get_ws_stats(),
+        "noise": get_noise_stats(),
+        "schedules": get_schedule.cache_info()._asdict(),
+    }
+
+_SCHEDULE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/schedule", response_model=ScheduleResponse)
+async def schedule(
+    request: Request,
+    steps: int = Query(..., ge=1, le=1000),
+    schedule: Literal["linear", "cosine"] = "linear",
+    beta_start: float = Query(0.001, ge=1e-8, le=0.5),
+    beta_end: float = Query(0.02, ge=1e-8, le=0.5),
+):
+    """
+    Beta schedule arrays for the given parameters (same defaults as /diffuse;
+    bounds as wide as /diffuse/ws, so every run's schedule can be fetched).
+    Responses are immutable per URL: strong ETag, one-year cache lifetime.
+    """
+    try:
+        body, etag = ScheduleService.get(steps, schedule, beta_start, beta_end)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Schedule failed: {e}")
+    headers = {"ETag": etag, "Cache-Control": _SCHEDULE_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _etag_matches(if_none_match: Optional[str], etag: str, wildcard: bool = True) -> bool:
+    # If-None-Match uses weak comparison: ignore W/ prefixes
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return (wildcard and "*" in tags) or any(t.removeprefix("W/") == etag for t in tags)
 
 @router.websocket("/diffuse/ws")
 async def diffuse_ws(ws: WebSocket):
@@ -35,8 +280,9 @@ async def diffuse_ws(ws: WebSocket):
     try:
         start_msg = await ws.receive_json()
         payload = WSStartPayload(**start_msg)
+        image = await DiffusionService.resolve_image(payload, ws)
 
-        task = asyncio.create_task(DiffuseWSService.run_diffusion(ws, payload))
+        task = asyncio.create_task(DiffuseWSService.run_diffusion(ws, payload, image))
 
         while True:
             other = await ws.receive_text()
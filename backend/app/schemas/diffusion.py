@@ -1,12 +1,45 @@
 from typing import Literal, Optional
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
-class DiffuseRequest(BaseModel):
-    image_b64: str = Field(
-        ...,
+class ImageSource(BaseModel):
+    """
+    Exactly one of image_b64 (inline upload) or image_id (an image already
+    stored through POST /images by the logged-in user).
+    """
+    image_b64: Optional[str] = Field(
+        None,
         description="Raw base64 or data URL: data:image/jpeg;base64,..."
     )
+    image_id: Optional[int] = Field(None, ge=1, description="id of a stored image")
+
+    @field_validator("image_b64")
+    def not_empty(cls, v: Optional[str]):
+        if v is not None and len(v) < 16:
+            raise ValueError("image_b64 looks invalid/empty")
+        return v
+
+    @model_validator(mode="after")
+    def one_source(self):
+        if (self.image_b64 is None) == (self.image_id is None):
+            raise ValueError("provide exactly one of image_b64 or image_id")
+        return self
+
+
+EncoderProfileName = Literal["fast-preview", "balanced", "archival"]
+
+
+class EncodeOptions(BaseModel):
+    """
+    How result images are encoded: image_format picks the codec, profile its
+    speed/size trade-off (see ENCODER_PROFILES in app/domain/ImageProcessor.py).
+    """
+    image_format: Literal["jpeg", "webp"] = "jpeg"
+    profile: EncoderProfileName = "balanced"
+    quality: Optional[int] = Field(None, ge=1, le=100, description="Overrides the profile's quality")
+
+
+class DiffuseRequest(ImageSource, EncodeOptions):
     steps: int = Field(..., ge=1, le=1000)
     schedule: Literal["linear", "cosine"] = "linear"
     seed: Optional[int] = None
@@ -17,20 +50,188 @@ class DiffuseRequest(BaseModel):
 
     return_data_url: bool = True  # return data URL for easy <img src=...>
 
+    # "image" answers with the encoded bytes themselves (metadata in X-Diffusion-* headers)
+    response_mode: Literal["json", "image"] = "json"
+
+
+class DiffuseRawParams(EncodeOptions):
+    """
+    Query parameters of POST /diffuse/raw (the body is the image file itself).
+    """
+    steps: int = Field(..., ge=1, le=1000)
+    schedule: Literal["linear", "cosine"] = "linear"
+    seed: Optional[int] = None
+
+    beta_start: float = Field(0.001, ge=1e-8, le=0.001)
+    beta_end: float = Field(0.02, ge=1e-8, le=0.02)
+
+
+class SessionCreateRequest(ImageSource, EncodeOptions):
+    steps: int = Field(..., ge=1, le=1000)
+    schedule: Literal["linear", "cosine"] = "linear"
+    seed: Optional[int] = None
+
+    beta_start: float = Field(0.001, ge=1e-8, le=0.001)
+    beta_end: float = Field(0.02, ge=1e-8, le=0.02)
+
+    mode: Literal["chain", "closed_form"] = Field(
+        "chain",
+        description="'chain' matches /diffuse/ws frames (checkpointed); 'closed_form' is O(1) per t",
+    )
+    preview_every: int = Field(
+        1, ge=1,
+        description="chain only: serve the frames of a /diffuse/ws run with this preview_every",
+    )
+
+
+class SessionResponse(BaseModel):
+    id: str
+    steps: int
+    mode: str
+    preview_every: int  # frames exist at t = 0, preview_every, ..., steps - 1
+    width: int
+    height: int
+    ttl_s: float  # idle time before the session expires
+
+
+class StreamParams(BaseModel):
+    """
+    Query parameters of the session stream endpoints (MJPEG and SSE).
+    """
+    preview_every: Optional[int] = Field(
+        None, ge=1, description="Emit a preview every N steps; defaults to the session's",
+    )
+    include_metrics: bool = False
+    metrics_downsample: int = Field(1, ge=1, le=8)
+
+
+class ExportParams(BaseModel):
+    """
+    Query parameters of the session animation export.
+    """
+    format: Literal["webp", "gif"] = "webp"
+    preview_every: int = Field(1, ge=1, description="Keep every N-th step")
+    fps: int = Field(12, ge=1, le=50)
+    loop: int = Field(0, ge=0, description="0 loops forever")
+    # WebP only: the profile sets quality, method and lossless; quality/lossless override it
+    profile: EncoderProfileName = "balanced"
+    quality: Optional[int] = Field(None, ge=1, le=100, description="WebP only")
+    lossless: Optional[bool] = Field(None, description="WebP only")
+
+
+class TrajectoryParams(BaseModel):
+    """
+    Query parameters of the session trajectory export (.npy / .npz).
+    """
+    format: Literal["npy", "npz"] = "npy"
+    dtype: Literal["uint8", "float16"] = Field(
+        "uint8", description="uint8: the streamed frames; float16: unclipped x_t",
+    )
+    preview_every: int = Field(1, ge=1, description="Keep every N-th step")
+    compress: bool = Field(False, description="npz only: deflate the members")
+    file: bool = Field(
+        False, description="npy only: serve a server-side file (HTTP Range support) instead of a stream",
+    )
+
+
+class DiffuseResponse(BaseModel):
+    image: str  # base64 or data URL depending on return_data_url
+    t: int      # the timestep used
+
+
+class DiffuseBatchRequest(EncodeOptions):
+    images: list[str] = Field(
+        ..., min_length=1, max_length=64,
+        description="Raw base64 or data URLs; all diffused with the same settings",
+    )
+    steps: int = Field(..., ge=1, le=1000)
+    schedule: Literal["linear", "cosine"] = "linear"
+    seed: Optional[int] = None
+
+    beta_start: Optional[float] = Field(0.001, ge=1e-8, le=0.001)
+    beta_end: Optional[float] = Field(0.02, ge=1e-8, le=0.02)
+
+    return_data_url: bool = True
+
+    @field_validator("images")
+    def not_empty(cls, v: list[str]):
+        for img in v:
+            if not img or len(img) < 16:
+                raise ValueError("images contains an invalid/empty entry")
+        return v
+
+
+class DiffuseBatchResponse(BaseModel):
+    items: list[DiffuseResponse]  # same order as the request images
+
+
+class BetaRange(BaseModel):
+    beta_start: float = Field(0.001, ge=1e-8, le=0.001)
+    beta_end: float = Field(0.02, ge=1e-8, le=0.02)
+
+
+class SweepRequest(EncodeOptions):
+    image_b64: str = Field(..., description="Raw base64 or data URL")
+    steps: int = Field(..., ge=1, le=1000)
+
+    # The grid is the cartesian product of these axes
+    schedules: list[Literal["linear", "cosine"]] = Field(["linear"], min_length=1)
+    beta_ranges: list[BetaRange] = Field(default_factory=lambda: [BetaRange()], min_length=1)
+    seeds: list[Optional[int]] = Field([None], min_length=1)
+    ts: Optional[list[int]] = Field(None, min_length=1, description="Timesteps; defaults to [steps - 1]")
+
+    output: Literal["sheet", "frames"] = "sheet"
+    return_data_url: bool = True
+
     @field_validator("image_b64")
     def not_empty(cls, v: str):
         if not v or len(v) < 16:
             raise ValueError("image_b64 looks invalid/empty")
         return v
 
+    @field_validator("ts")
+    def non_negative(cls, v: Optional[list[int]]):
+        if v is not None and any(t < 0 for t in v):
+            raise ValueError("ts must be >= 0")
+        return v
 
-class DiffuseResponse(BaseModel):
-    image: str  # base64 or data URL depending on return_data_url
-    t: int      # the timestep used
+    @model_validator(mode="after")
+    def grid_size(self):
+        n = len(self.schedules) * len(self.beta_ranges) * len(self.seeds) * len(self.ts or [0])
+        if n > 256:
+            raise ValueError(f"sweep grid has {n} points; at most 256 allowed")
+        return self
 
 
-class WSStartPayload(BaseModel):
-    image_b64: str = Field(..., description="data URL or raw base64")
+class SweepCell(BaseModel):
+    schedule: str
+    beta_start: float
+    beta_end: float
+    seed: Optional[int]
+    t: int
+
+
+class SweepResponse(BaseModel):
+    cells: list[SweepCell]          # grid points, row-major over the sheet
+    cols: int                       # one column per t
+    rows: int
+    image: Optional[str] = None     # contact sheet (output="sheet")
+    frames: Optional[list[str]] = None  # one image per cell (output="frames")
+
+
+class ScheduleResponse(BaseModel):
+    steps: int
+    schedule: str
+    beta_start: float
+    beta_end: float
+    beta: list[float]
+    alpha: list[float]
+    alpha_bar: list[float]
+    sqrt_alpha_bar: list[float]
+    sqrt_one_minus_alpha_bar: list[float]
+
+
+class WSStartPayload(ImageSource, EncodeOptions):
     steps: int = Field(..., ge=1, le=1000)
     schedule: Literal["linear", "cosine"] = "linear"
     seed: Optional[int] = None
@@ -40,6 +241,39 @@ class WSStartPayload(BaseModel):
     beta_end: float = Field(2e-2, ge=1e-8, le=0.5)
 
     preview_every: int = Field(1, ge=1, description="Emit a preview every N steps")
-    quality: int = Field(85, ge=1, le=100)
+    profile: EncoderProfileName = "fast-preview"  # previews favour encode speed over bytes
     data_url: bool = True
-    include_metrics: bool = False
\ No newline at end of file
+    include_metrics: bool = False
+    metrics_downsample: int = Field(
+        1, ge=1, le=8,
+        description="Compute metrics on every N-th row/column (faster, approximate)",
+    )
+
+    max_pending: int = Field(
+        2, ge=1, le=64,
+        description="Outbound previews buffered for a slow client before stale ones are dropped",
+    )
+    protocol: Literal["json", "binary"] = Field(
+        "json",
+        description="'binary' sends frames as header + raw image bytes (see app/services/frame_protocol.py)",
+    )
+
+
+class CurvesRequest(BaseModel):
+    image_b64: str = Field(..., description="data URL or raw base64")
+    steps: int = Field(..., ge=1, le=1000)
+    schedule: Literal["linear", "cosine"] = "linear"
+    beta_start: float = Field(1e-3, ge=1e-8, le=0.5)
+    beta_end: float = Field(2e-2, ge=1e-8, le=0.5)
+
+
+class CurvesResponse(BaseModel):
+    # One entry per timestep t = 0..steps-1
+    beta: list[float]
+    alpha_bar: list[float]
+    cosine: list[float]
+    psnr: list[float]
+    snr_db: list[float]
+    ssim: list[float]
+    mean: list[float]
+    std: list[float]
@@ -1,22 +1,214 @@
-from fastapi import WebSocket
-from app.domain.Diffusion import Diffusion
-from app.schemas.diffusion import DiffuseRequest, DiffuseResponse, WSStartPayload
-from app.domain.Diffusion import Diffusion
-from app.domain.ImageProcessor import ImageProcessor
-import asyncio, json
+from fastapi import HTTPException, WebSocket
+from fastapi.requests import HTTPConnection
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple, TypeVar, Union
+from app.core.config import settings
+from app.core.executor import get_executor
+from app.core.security import get_sub_from_access_cookie
+from app.db.session import AsyncSessionLocal
+from app.domain.Animation import GifStream, encode_webp_animation
+from app.domain.BetaScheduler import BetaScheduler
+from app.domain.Trajectory import NpzStream, npy_header
+from app.domain.Diffusion import Diffusion, SweepPoint, x0_cache
+from app.schemas.diffusion import (
+    CurvesRequest,
+    CurvesResponse,
+    DiffuseBatchRequest,
+    DiffuseBatchResponse,
+    DiffuseRawParams,
+    DiffuseRequest,
+    DiffuseResponse,
+    EncodeOptions,
+    ExportParams,
+    ImageSource,
+    ScheduleResponse,
+    SweepCell,
+    SweepRequest,
+    SessionCreateRequest,
+    SessionResponse,
+    StreamParams,
+    SweepResponse,
+    TrajectoryParams,
+    WSStartPayload,
+)
+from app.domain.ImageProcessor import ImageProcessor, get_profile, mime_for, payload_digest
+from app.domain.LRUCache import ByteBudgetLRU
+from app.repositories.image_repo import ImageRepo
+from app.services.image_service import ImageService
+from app.domain.Noise import NoiseBank, NoiseProvider, get_noise_provider, set_noise_provider
+from app.services.frame_protocol import pack_frame
+from app.services.outbound import LatestWinsQueue
+from app.services.session_store import DiffusionSession, SessionStore, remove_stale_exports
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+import asyncio, hashlib, json, logging
+import numpy as np
 
+logger = logging.getLogger(__name__)
 
-_last_beta_array: list[float] = []
+T = TypeVar("T")
+
+
+x0_cache.resize(settings.X0_CACHE_MAX_BYTES)
+if settings.NOISE_THREADS > 1 or settings.NOISE_BANK_DIR:
+    set_noise_provider(NoiseProvider(
+        threads=settings.NOISE_THREADS,
+        bank=NoiseBank(
+            settings.NOISE_BANK_DIR,
+            settings.NOISE_BANK_MAX_BYTES,
+            dtype=settings.NOISE_BANK_DTYPE,
+        ) if settings.NOISE_BANK_DIR else None,
+    ))
+
+@dataclass(frozen=True)
+class RenderedResponse:
+    """
+    A finished /diffuse HTTP response body; seeded ones are cached whole.
+    """
+    body: bytes
+    media_type: str
+    headers: dict[str, str]
+
+
+# Seeded /diffuse responses by input hash; a repeat costs a hash + lookup
+response_cache = ByteBudgetLRU(settings.DIFFUSE_CACHE_MAX_BYTES, sizeof=lambda r: len(r.body))
+
+def get_response_cache_stats() -> dict:
+    return response_cache.stats()
+
+
+session_store = SessionStore(settings.SESSION_MAX_BYTES, settings.SESSION_TTL_S, settings.EXPORT_MAX_BYTES)
+remove_stale_exports(settings.EXPORT_TMP_DIR)
+
+def get_session_stats() -> dict:
+    return session_store.stats()
+
+
+# Process-wide /diffuse/ws counters, used to tune preview_every / max_pending
+_ws_counters = {"frames_emitted": 0, "frames_dropped": 0}
+
+def get_ws_stats() -> dict:
+    return dict(_ws_counters)
+
+def get_noise_stats() -> dict:
+    return get_noise_provider().stats()
+
+
+def _next_emitted(
+    frames: Iterator[Tuple[int, float, np.ndarray]],
+    stride: int,
+    steps: int,
+) -> Optional[Tuple[int, float, np.ndarray]]:
+    # Advance the generator up to the next preview frame in one executor hop
+    for t, beta, frame in frames:
+        if (t % stride) == 0 or (t == steps - 1):
+            return t, beta, frame
+    return None
 
-def get_last_beta_array() -> list[float]:
-    return _last_beta_array
 
 class DiffusionService:
 
     @staticmethod
-    def run_diffusion(req: DiffuseRequest) -> DiffuseResponse:
-        inst = Diffusion(
-            encoded_img=req.image_b64,
+    async def resolve_image(src: ImageSource, conn: HTTPConnection) -> Union[str, bytes]:
+        """
+        Inline base64 as-is, or the stored bytes of src.image_id for the
+        logged-in user (cookie auth; works for HTTP and WebSocket). Stored
+        bytes skip base64 decoding and share the decoded x0 cache.
+        The lookup uses its own short-lived DB session, so no pooled
+        connection stays checked out for the diffusion or stream that follows.
+        """
+        if src.image_id is None:
+            return src.image_b64
+        user_id = int(get_sub_from_access_cookie(conn))
+        async with AsyncSessionLocal() as db:
+            img = await ImageService(ImageRepo(db)).get_user_image(src.image_id, user_id)
+        if not img:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return img.image_data
+
+    @staticmethod
+    async def render(
+        req: Union[DiffuseRequest, DiffuseRawParams],
+        image: Union[str, bytes],
+    ) -> RenderedResponse:
+        """
+        Full HTTP body for /diffuse (JSON or image, per response_mode) and /diffuse/raw.
+        Seeded requests are pure functions of their inputs: they get a strong
+        ETag (content hash) and are served from response_cache on repeats.
+        """
+        key = None
+        if req.seed is not None:
+            key = DiffusionService._response_key(req, image)
+            hit = response_cache.get(key)
+            if hit is not None:
+                return hit
+
+        if getattr(req, "response_mode", "image") == "image":
+            data, t, shape = await DiffusionService.run_diffusion_bytes(req, image)
+            headers = {
+                "X-Diffusion-T": str(t),
+                "X-Diffusion-Steps": str(req.steps),
+                "X-Diffusion-Schedule": req.schedule,
+                "X-Diffusion-Width": str(shape[1]),
+                "X-Diffusion-Height": str(shape[0]),
+            }
+            rendered = RenderedResponse(data, mime_for(req.image_format), headers)
+        else:
+            resp = await DiffusionService.run_diffusion(req, image)
+            rendered = RenderedResponse(resp.model_dump_json().encode("utf-8"), "application/json", {})
+
+        if key is not None:
+            rendered.headers["X-Diffusion-Seed"] = str(req.seed)
+            rendered.headers["ETag"] = '"' + hashlib.blake2b(rendered.body, digest_size=16).hexdigest() + '"'
+            response_cache.put(key, rendered)
+        return rendered
+
+    @staticmethod
+    def _response_key(
+        req: Union[DiffuseRequest, DiffuseRawParams],
+        image: Union[str, bytes],
+    ) -> str:
+        # Everything the output bytes depend on, including which noise a seed maps to
+        parts = (
+            payload_digest(image), req.steps, req.schedule,
+            float(req.beta_start), float(req.beta_end), int(req.seed),
+            get_noise_provider().fingerprint(),
+            getattr(req, "response_mode", "image"), req.image_format, req.profile, req.quality,
+            getattr(req, "return_data_url", False),
+        )
+        return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    async def run_diffusion(req: DiffuseRequest, image: Union[str, bytes]) -> DiffuseResponse:
+        return await get_executor().run("diffuse", DiffusionService._render, req, image)
+
+    @staticmethod
+    async def run_diffusion_bytes(
+        req: Union[DiffuseRequest, DiffuseRawParams],
+        image: Union[str, bytes],
+    ) -> Tuple[bytes, int, Tuple[int, int, int]]:
+        """
+        (encoded image bytes, t, frame shape) with no base64/JSON wrapping.
+        """
+        return await get_executor().run("diffuse", DiffusionService._render_bytes, req, image)
+
+    @staticmethod
+    def _render_bytes(
+        req: Union[DiffuseRequest, DiffuseRawParams],
+        image: Union[str, bytes],
+    ) -> Tuple[bytes, int, Tuple[int, int, int]]:
+        inst = DiffusionService._instance(req, image)
+        t = req.steps - 1
+        frame = inst.fast_diffuse(t)
+        data = ImageProcessor.array_to_bytes(
+            frame, format=req.image_format.upper(), quality=req.quality, profile=req.profile,
+        )
+        return data, t, frame.shape
+
+    @staticmethod
+    def _instance(req: Union[DiffuseRequest, DiffuseRawParams], image: Union[str, bytes]) -> Diffusion:
+        return Diffusion(
+            encoded_img=image,
             steps=req.steps,
             beta_start=req.beta_start,
             beta_end=req.beta_end,
@@ -24,36 +216,440 @@ class DiffusionService:
             seed=req.seed,
             max_side=256,  # protect server from huge uploads
         )
-        global _last_beta_array
-        _last_beta_array.clear()
+
+    @staticmethod
+    def _render(req: DiffuseRequest, image: Union[str, bytes]) -> DiffuseResponse:
+        # Runs inside the compute executor (possibly another process)
+        inst = DiffusionService._instance(req, image)
 
         # For now: just return the final step (t = steps-1)
         t = req.steps - 1
 
-        if req.return_data_url:
-            image_out = inst.fast_diffuse_base64(
-                t,
-                data_url=True,
-                format="JPEG",
-                quality=92,
-            )
-        else:
-            image_out = inst.fast_diffuse_base64(
-                t,
-                data_url=False,
-                format="JPEG",
-                quality=92
-            )
-        _last_beta_array = inst.beta.tolist()
-        print(_last_beta_array)
+        image_out = inst.fast_diffuse_base64(
+            t,
+            data_url=req.return_data_url,
+            format=req.image_format.upper(),
+            quality=req.quality,
+            profile=req.profile,
+        )
         return DiffuseResponse(image=image_out, t=t)
 
+    @staticmethod
+    async def run_batch(req: DiffuseBatchRequest) -> DiffuseBatchResponse:
+        return await get_executor().run("diffuse_batch", DiffusionService._render_batch, req)
+
+    @staticmethod
+    def _render_batch(req: DiffuseBatchRequest) -> DiffuseBatchResponse:
+        t = req.steps - 1
+        frames = Diffusion.fast_diffuse_batch(
+            req.images,
+            steps=req.steps,
+            beta_start=req.beta_start,
+            beta_end=req.beta_end,
+            beta_schedule=req.schedule,
+            t=t,
+            seed=req.seed,
+            max_side=256,
+        )
+        encode = ImageProcessor.array_to_data_url if req.return_data_url else ImageProcessor.array_to_base64
+        items = [DiffuseResponse(image=encode(f, **_encode_kwargs(req)), t=t) for f in frames]
+        return DiffuseBatchResponse(items=items)
+
+    @staticmethod
+    async def run_sweep(req: SweepRequest) -> SweepResponse:
+        return await get_executor().run("sweep", DiffusionService._sweep, req)
+
+    @staticmethod
+    def _sweep(req: SweepRequest) -> SweepResponse:
+        ts = [min(t, req.steps - 1) for t in (req.ts or [req.steps - 1])]
+        # Row-major: one row per (schedule, beta range, seed), one column per t
+        points = [
+            SweepPoint(schedule, br.beta_start, br.beta_end, seed, t)
+            for schedule in req.schedules
+            for br in req.beta_ranges
+            for seed in req.seeds
+            for t in ts
+        ]
+        frames = Diffusion.sweep(
+            req.image_b64,
+            steps=req.steps,
+            points=points,
+            max_side=256,
+            max_chunk_bytes=settings.SWEEP_MAX_CHUNK_BYTES,
+        )
+        encode = ImageProcessor.array_to_data_url if req.return_data_url else ImageProcessor.array_to_base64
+        resp = SweepResponse(
+            cells=[SweepCell(**vars(p)) for p in points],
+            cols=len(ts),
+            rows=len(points) // len(ts),
+        )
+        if req.output == "sheet":
+            sheet = ImageProcessor.contact_sheet(frames, cols=len(ts))
+            resp.image = encode(sheet, **_encode_kwargs(req))
+        else:
+            resp.frames = [encode(f, **_encode_kwargs(req)) for f in frames]
+        return resp
 
-class DiffuseWSService:
     @staticmethod
-    async def run_diffusion(ws: WebSocket, payload: WSStartPayload):
+    async def expected_curves(req: CurvesRequest) -> CurvesResponse:
+        return await get_executor().run("curves", DiffusionService._curves, req)
+
+    @staticmethod
+    def _curves(req: CurvesRequest) -> CurvesResponse:
         inst = Diffusion(
-            encoded_img=payload.image_b64,
+            encoded_img=req.image_b64,
+            steps=req.steps,
+            beta_start=req.beta_start,
+            beta_end=req.beta_end,
+            beta_schedule=req.schedule,
+            max_side=256,  # same key as /diffuse, so x0 and its stats are usually cached
+        )
+        curves = inst.expected_metrics()
+        return CurvesResponse(
+            beta=inst.beta.tolist(),
+            alpha_bar=inst.alpha_bar.tolist(),
+            **{name: values.tolist() for name, values in curves.items()},
+        )
+
+
+class SessionService:
+
+    @staticmethod
+    async def create(req: SessionCreateRequest, image: Union[str, bytes]) -> SessionResponse:
+        # Diffusion holds the checkpoint index and work buffers, so it stays in-process
+        inst = await get_executor().run_threaded(
+            "decode",
+            Diffusion,
+            encoded_img=image,
+            steps=req.steps,
+            beta_start=req.beta_start,
+            beta_end=req.beta_end,
+            beta_schedule=req.schedule,
+            seed=req.seed,
+            max_side=512,  # same frames as /diffuse/ws, so sessions can back its timeline
+            checkpoint_budget=settings.SESSION_CHECKPOINT_BYTES,
+        )
+        session = DiffusionSession(
+            inst,
+            mode=req.mode,
+            stride=req.preview_every,
+            image_format=req.image_format,
+            quality=req.quality,
+            profile=req.profile,
+            frame_budget=settings.SESSION_FRAME_CACHE_BYTES,
+            disk=session_store.disk,
+        )
+        session_store.add(session)
+        h, w = inst.img_shape[:2]
+        return SessionResponse(id=session.id, steps=inst.steps, mode=session.mode,
+                               preview_every=session.stride, width=w, height=h,
+                               ttl_s=session_store.ttl_s)
+
+    @staticmethod
+    async def frame(session_id: str, t: int) -> Tuple[bytes, str]:
+        """
+        (encoded frame, media type). Cached frames are served without leaving the event loop.
+        """
+        session = session_store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        if not (0 <= t < session.inst.steps):
+            raise HTTPException(status_code=400, detail=f"t must be in [0, {session.inst.steps})")
+        if not session.has_frame(t):
+            raise HTTPException(status_code=400,
+                                detail=f"t={t} is not a frame of this session (preview_every={session.stride})")
+        data = session.cached_frame(t)
+        if data is None:
+            # Concurrent GETs for the same t share one render, and a session
+            # sends one render at a time to the executor; everyone else waits
+            # here on the event loop instead of holding an executor slot.
+            render = session.renders.get(t)
+            if render is None:
+                render = asyncio.ensure_future(SessionService._render(session, t))
+                session.renders[t] = render
+                render.add_done_callback(lambda f: _render_done(session, t, f))
+            data = await asyncio.shield(render)
+        return data, session.media_type
+
+    @staticmethod
+    async def _render(session: DiffusionSession, t: int) -> bytes:
+        async with session.render_lock:
+            data = session.cached_frame(t)  # a stream may have produced it meanwhile
+            if data is None:
+                data = await get_executor().run_threaded("session_frame", session.render, t)
+                session_store.enforce_budget()
+            return data
+
+    @staticmethod
+    def delete(session_id: str) -> bool:
+        return session_store.delete(session_id)
+
+
+def _render_done(session: DiffusionSession, t: int, render: asyncio.Future) -> None:
+    session.renders.pop(t, None)
+    if not render.cancelled():
+        render.exception()  # retrieved, even if every waiter has gone away
+
+
+def _encode_kwargs(opts: EncodeOptions) -> dict:
+    # ImageProcessor.array_to_* keyword arguments for a request's encoding options
+    return {"format": opts.image_format.upper(), "quality": opts.quality, "profile": opts.profile}
+
+
+def _frame_bytes(t: int, frame: np.ndarray) -> bytes:
+    return frame.tobytes()
+
+
+class StreamService:
+    """
+    HTTP streaming of a chain-mode session's frames() trajectory: MJPEG
+    (multipart/x-mixed-replace, usable directly as <img src>) and SSE
+    (metadata only; when preview_every equals the session's, each event links
+    the frame, which streaming has already put in the session's frame cache).
+    Other strides sample a different chain (see Diffusion.frames), so their
+    frames are neither cached nor linked. Pacing follows the client:
+    the generator only advances as the response body is consumed.
+    """
+
+    BOUNDARY = "frame"
+
+    @staticmethod
+    def session(session_id: str) -> DiffusionSession:
+        session = session_store.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        if session.mode != "chain":
+            raise HTTPException(status_code=400, detail="Streaming needs a chain-mode session")
+        return session
+
+    @staticmethod
+    def stride(session: DiffusionSession, params: StreamParams) -> int:
+        return params.preview_every or session.stride
+
+    @staticmethod
+    def cacheable(session: DiffusionSession, params: StreamParams) -> bool:
+        # Only a stream at the session's stride produces the frames GET /frames/{t} serves
+        return StreamService.stride(session, params) == session.stride
+
+    @staticmethod
+    async def frames(
+        session: DiffusionSession,
+        params: StreamParams,
+    ) -> AsyncIterator[Tuple[int, float, bytes, Optional[dict]]]:
+        """
+        (t, beta, encoded frame, metrics) for every emitted step, in order.
+        """
+        downsample = params.metrics_downsample if params.include_metrics else None
+        cache = StreamService.cacheable(session, params)
+        try:
+            async for t, beta, (data, metrics) in StreamService.pipeline(
+                session.inst, StreamService.stride(session, params),
+                lambda t, frame: session.encode(t, frame, downsample, cache=cache),
+                checkpoint=cache,
+            ):
+                yield t, beta, data, metrics
+        finally:
+            session_store.enforce_budget()
+
+    @staticmethod
+    async def pipeline(
+        inst: Diffusion,
+        stride: int,
+        encode: Callable[[int, np.ndarray], T],
+        dtype: str = "uint8",
+        checkpoint: bool = False,
+    ) -> AsyncIterator[Tuple[int, float, T]]:
+        """
+        (t, beta, encode(t, frame)) for every emitted step of inst.frames(), in
+        order. Up to WS_ENCODE_DEPTH encodes run ahead in the executor.
+        checkpoint=True fills inst's checkpoint index (sessions only).
+        """
+        executor = get_executor()
+        steps = inst.steps
+        depth = settings.WS_ENCODE_DEPTH
+
+        frames = inst.frames(stride=stride, out_buffers=depth + 2, dtype=dtype, checkpoint=checkpoint)
+        inflight: deque = deque()
+        try:
+            while True:
+                step = await executor.run_threaded("frames", _next_emitted, frames, stride, steps)
+                if step is not None:
+                    t, beta, frame = step
+                    inflight.append((t, beta, asyncio.ensure_future(
+                        executor.run_threaded("encode", encode, t, frame)
+                    )))
+                if not inflight:
+                    break
+                if step is None or len(inflight) >= depth:
+                    t, beta, encoding = inflight.popleft()
+                    yield t, beta, await encoding
+        finally:
+            for *_, encoding in inflight:
+                encoding.cancel()
+
+    @staticmethod
+    async def gif(session: DiffusionSession, params: ExportParams) -> AsyncIterator[bytes]:
+        """
+        Animated GIF written piece by piece while the chain runs.
+        """
+        writer = GifStream(duration_ms=round(1000 / params.fps), loop=params.loop)
+        first_t = session.inst.emitted_timesteps(params.preview_every)[0]
+
+        def encode(t: int, frame: np.ndarray) -> bytes:
+            data = writer.frame(frame)
+            return writer.header(frame) + data if t == first_t else data
+
+        async for _, _, data in StreamService.pipeline(session.inst, params.preview_every, encode):
+            yield data
+        yield GifStream.TRAILER
+
+    @staticmethod
+    def npy_length(session: DiffusionSession, params: TrajectoryParams) -> int:
+        shape = StreamService._trajectory_shape(session, params)
+        return len(npy_header(np.dtype(params.dtype), shape)) + int(np.prod(shape)) * np.dtype(params.dtype).itemsize
+
+    @staticmethod
+    async def npy(session: DiffusionSession, params: TrajectoryParams) -> AsyncIterator[bytes]:
+        """
+        (N, H, W, C) .npy: header, then each frame's raw bytes as it is produced.
+        """
+        yield npy_header(np.dtype(params.dtype), StreamService._trajectory_shape(session, params))
+        async for _, _, data in StreamService.pipeline(
+            session.inst, params.preview_every, _frame_bytes, dtype=params.dtype,
+        ):
+            yield data
+
+    @staticmethod
+    async def npz(session: DiffusionSession, params: TrajectoryParams) -> AsyncIterator[bytes]:
+        """
+        .npz with t (N,), beta (N,) and frames (N, H, W, C), zipped on the fly.
+        """
+        inst = session.inst
+        emitted = inst.emitted_timesteps(params.preview_every)
+        archive = NpzStream(compress=params.compress)
+        archive.add_array("t", np.asarray(emitted, dtype=np.int32))
+        archive.add_array("beta", inst.beta[emitted])
+        archive.begin("frames", np.dtype(params.dtype), StreamService._trajectory_shape(session, params))
+        yield archive.take()
+        async for _, _, data in StreamService.pipeline(
+            inst, params.preview_every, _frame_bytes, dtype=params.dtype,
+        ):
+            if params.compress:
+                await get_executor().run_threaded("export", archive.write, data)
+            else:
+                archive.write(data)
+            chunk = archive.take()
+            if chunk:
+                yield chunk
+        archive.end()
+        archive.close()
+        yield archive.take()
+
+    @staticmethod
+    async def npy_file(session: DiffusionSession, params: TrajectoryParams) -> str:
+        return await get_executor().run_threaded(
+            "export", session.trajectory_file, params.preview_every, params.dtype, settings.EXPORT_TMP_DIR,
+        )
+
+    @staticmethod
+    def _trajectory_shape(session: DiffusionSession, params: TrajectoryParams) -> Tuple[int, ...]:
+        n = len(session.inst.emitted_timesteps(params.preview_every))
+        return (n, *session.inst.img_shape)
+
+    @staticmethod
+    async def webp(session: DiffusionSession, params: ExportParams) -> bytes:
+        """
+        Animated WebP. libwebp only emits the file once every frame is in, so
+        this runs as one executor job that pulls frames one at a time.
+        """
+        inst, stride = session.inst, params.preview_every
+        frames = inst.frames(stride=stride)
+        profile = get_profile(params.profile)
+
+        def next_frame() -> Optional[np.ndarray]:
+            step = _next_emitted(frames, stride, inst.steps)
+            return None if step is None else step[2]
+
+        return await get_executor().run_threaded(
+            "export",
+            encode_webp_animation,
+            next_frame,
+            len(inst.emitted_timesteps(stride)),
+            duration_ms=round(1000 / params.fps),
+            quality=params.quality if params.quality is not None else profile.webp_quality,
+            lossless=params.lossless if params.lossless is not None else profile.webp_lossless,
+            method=profile.webp_method,
+            loop=params.loop,
+        )
+
+    @staticmethod
+    async def mjpeg(session: DiffusionSession, params: StreamParams) -> AsyncIterator[bytes]:
+        async for t, _, data, _ in StreamService.frames(session, params):
+            yield (
+                f"--{StreamService.BOUNDARY}\r\n"
+                f"Content-Type: {session.media_type}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"X-Diffusion-T: {t}\r\n\r\n"
+            ).encode("ascii") + data + b"\r\n"
+
+    @staticmethod
+    async def events(session: DiffusionSession, params: StreamParams) -> AsyncIterator[bytes]:
+        steps = session.inst.steps
+        linked = StreamService.cacheable(session, params)
+        last = None
+        async for t, beta, _, metrics in StreamService.frames(session, params):
+            last = {
+                "t": t,
+                "beta": beta,
+                "step": t + 1,
+                "progress": (t + 1) / steps,
+            }
+            if linked:
+                last["frame_url"] = f"/diffuse/sessions/{session.id}/frames/{t}"
+            if metrics is not None:
+                last["metrics"] = metrics
+            yield f"event: frame\nid: {t}\ndata: {json.dumps(last)}\n\n".encode("utf-8")
+        yield f"event: done\ndata: {json.dumps(last)}\n\n".encode("utf-8")
+
+
+class ScheduleService:
+
+    @staticmethod
+    def get(steps: int, schedule: str, beta_start: float, beta_end: float) -> Tuple[bytes, str]:
+        """
+        (JSON body, strong ETag) for a schedule. The body depends only on the
+        parameters, so it can be cached forever by browsers and proxies.
+        """
+        return _schedule_body(int(steps), schedule, float(beta_start), float(beta_end))
+
+
+@lru_cache(maxsize=128)
+def _schedule_body(steps: int, schedule: str, beta_start: float, beta_end: float) -> Tuple[bytes, str]:
+    res = BetaScheduler(steps, schedule, beta_start, beta_end).get_all()
+    body = ScheduleResponse(
+        steps=steps,
+        schedule=schedule,
+        beta_start=beta_start,
+        beta_end=beta_end,
+        beta=res.beta.tolist(),
+        alpha=res.alpha.tolist(),
+        alpha_bar=res.alpha_bar.tolist(),
+        sqrt_alpha_bar=res.sqrt_alpha_bar.tolist(),
+        sqrt_one_minus_alpha_bar=res.sqrt_one_minus_alpha_bar.tolist(),
+    ).model_dump_json().encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return body, etag
+
+
+class DiffuseWSService:
+    @staticmethod
+    async def run_diffusion(ws: WebSocket, payload: WSStartPayload, image: Union[str, bytes]):
+        executor = get_executor()
+        # Diffusion holds a live generator, so it stays in-process (run_threaded)
+        inst = await executor.run_threaded(
+            "decode",
+            Diffusion,
+            encoded_img=image,
             steps=payload.steps,
             beta_start=payload.beta_start,
             beta_end=payload.beta_end,
@@ -61,39 +657,68 @@ class DiffuseWSService:
             seed=payload.seed,
             max_side=512,
         )
-        global _last_beta_array
-        _last_beta_array.clear()
         steps = payload.steps
         stride = max(1, payload.preview_every)
+        binary = payload.protocol == "binary"
+        emitted = inst.emitted_timesteps(stride)
 
         last_encoded = None
         last_metrics = None
         beta = None
 
-        for t, beta, frame in inst.frames():
-            if (t % stride) == 0 or (t == steps - 1):
-                encoded = (
-                    ImageProcessor.array_to_data_url(
-                        frame, format="JPEG", quality=payload.quality
-                    )
-                    if payload.data_url
-                    else ImageProcessor.array_to_base64(
-                        frame, format="JPEG", quality=payload.quality
-                    )
-                )
+        # Pipeline: producer (frames) -> bounded queue of in-flight encodes -> sender.
+        # Encodes run concurrently in the executor; the queue keeps them in order.
+        pending: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_ENCODE_DEPTH)
 
-                metrics = None
-                if payload.include_metrics:
-                    try:
-                        metrics = inst._compute_metrics(
-                            frame, (inst.x0 * 255.0 + 0.5).astype("uint8")
-                        )
-                    except Exception:
-                        metrics = None
+        async def produce():
+            try:
+                # Strided mode only samples the timesteps we are going to emit
+                # Frames come from reused buffers: enough for every frame queued or
+                # still encoding (depth) plus the one being awaited and the next one
+                frames = inst.frames(stride=stride, out_buffers=settings.WS_ENCODE_DEPTH + 2)
+                while True:
+                    step = await executor.run_threaded("frames", _next_emitted, frames, stride, steps)
+                    if step is None:
+                        break
+                    t, beta, frame = step
+                    encoding = asyncio.ensure_future(executor.run_threaded(
+                        "encode", DiffuseWSService._encode_frame, inst, frame, payload
+                    ))
+                    await pending.put((t, beta, encoding))
+            except Exception as e:
+                await pending.put(e)
+            else:
+                await pending.put(None)
 
-                last_encoded = encoded
+        # Outbound side: latest-wins buffer drained by its own sender task, so a
+        # slow client never stalls generation; stale previews are dropped instead.
+        outbound = LatestWinsQueue(maxsize=payload.max_pending)
+
+        async def send_all():
+            while (msg := await outbound.get()) is not None:
+                if isinstance(msg, bytes):
+                    await ws.send_bytes(msg)
+                else:
+                    await ws.send_text(msg)
+
+        producer = asyncio.create_task(produce())
+        sender = asyncio.create_task(send_all())
+        try:
+            while (item := await pending.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                t, beta, encoding = item
+                encoded, metrics = await encoding
                 last_metrics = metrics
+                final = t == steps - 1
 
+                if binary:
+                    outbound.put(pack_frame(
+                        t, steps, beta, encoded, format=payload.image_format, metrics=metrics, final=final
+                    ), droppable=not final)
+                    continue
+
+                last_encoded = encoded
                 msg = {
                     "t": t,
                     "beta": beta,
@@ -104,19 +729,58 @@ class DiffuseWSService:
                 if metrics is not None:
                     msg["metrics"] = metrics
 
-                await ws.send_text(json.dumps(msg))
+                outbound.put(json.dumps(msg), droppable=not final)
 
-            await asyncio.sleep(0)
-            _last_beta_array.append(beta)
+            if binary:
+                # The final frame already went out with FLAG_FINAL; don't resend the image
+                done = {
+                    "status": "done",
+                    "t": steps - 1,
+                    "beta": beta,
+                }
+            else:
+                done = {
+                    "status": "done",
+                    "t": steps - 1,
+                    "beta": beta,
+                    "step": steps,
+                    "progress": 1.0,
+                    "image": last_encoded,
+                }
+            if last_metrics is not None:
+                done["metrics"] = last_metrics
+            done["dropped"] = outbound.dropped
+            outbound.put(json.dumps(done), droppable=False)
+            outbound.put(None, droppable=False)
+            await sender
+        finally:
+            producer.cancel()
+            sender.cancel()
+            while not pending.empty():
+                item = pending.get_nowait()
+                if isinstance(item, tuple):
+                    item[2].cancel()
 
-        await ws.send_text(json.dumps({
-            "status": "done",
-            "t": steps - 1,
-            "beta": beta,
-            "step": steps,
-            "progress": 1.0,
-            "image": last_encoded,
-            **({"metrics": last_metrics} if last_metrics is not None else {}),
-        }))
+        _ws_counters["frames_emitted"] += len(emitted)
+        _ws_counters["frames_dropped"] += outbound.dropped
+        if outbound.dropped:
+            logger.info("diffuse/ws: dropped %d of %d previews for a slow client",
+                        outbound.dropped, len(emitted))
         await ws.close()
- 
\ No newline at end of file
+
+    @staticmethod
+    def _encode_frame(inst: Diffusion, frame: np.ndarray, payload: WSStartPayload) -> Tuple[Union[str, bytes], Optional[dict]]:
+        if payload.protocol == "binary":
+            encoded = ImageProcessor.array_to_bytes(frame, **_encode_kwargs(payload))
+        elif payload.data_url:
+            encoded = ImageProcessor.array_to_data_url(frame, **_encode_kwargs(payload))
+        else:
+            encoded = ImageProcessor.array_to_base64(frame, **_encode_kwargs(payload))
+
+        metrics = None
+        if payload.include_metrics:
+            try:
+                metrics = inst.compute_metrics(frame, downsample=payload.metrics_downsample)
+            except Exception:
+                metrics = None
+        return encoded, metrics
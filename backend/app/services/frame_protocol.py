@@ -0,0 +1,61 @@
+"""
+Binary frame protocol for /diffuse/ws (opt-in via WSStartPayload.protocol="binary").
+
+Every preview frame is one binary WebSocket message: a fixed 24-byte
+little-endian header followed by the raw encoded image bytes.
+
+    offset  type  field
+    0       u8    version (1)
+    1       u8    flags: bit0 = final frame, bit1 = metrics present
+    2       u16   image format: 1 = JPEG, 2 = PNG, 3 = WEBP
+    4       u32   t
+    8       u32   steps
+    12      f32   beta
+    16      f32   SSIM   (NaN when metrics are absent)
+    20      f32   cosine (NaN when metrics are absent)
+    24      ...   image bytes
+
+The run still ends with a JSON text message {"status": "done", ...}.
+"""
+from __future__ import annotations
+import math
+import struct
+from typing import Optional
+
+PROTOCOL_VERSION = 1
+
+FLAG_FINAL = 0x01
+FLAG_METRICS = 0x02
+
+FORMAT_CODES = {"JPEG": 1, "JPG": 1, "PNG": 2, "WEBP": 3}
+
+FRAME_HEADER = struct.Struct("<BBHIIfff")
+
+
+def pack_frame(
+    t: int,
+    steps: int,
+    beta: float,
+    image: bytes,
+    *,
+    format: str = "JPEG",
+    metrics: Optional[dict] = None,
+    final: bool = False,
+) -> bytes:
+    flags = FLAG_FINAL if final else 0
+    ssim = cosine = math.nan
+    if metrics is not None:
+        flags |= FLAG_METRICS
+        ssim = float(metrics.get("SSIM", math.nan))
+        cosine = float(metrics.get("Cosine", math.nan))
+    header = FRAME_HEADER.pack(
+        PROTOCOL_VERSION,
+        flags,
+        FORMAT_CODES[format.upper()],
+        t,
+        steps,
+        beta,
+        ssim,
+        cosine,
+    )
+    return header + image
@@ -0,0 +1,42 @@
+from __future__ import annotations
+import asyncio
+from collections import deque
+from typing import Any, Optional
+
+
+class LatestWinsQueue:
+    """
+    Bounded per-connection outbound buffer with latest-wins coalescing.
+
+    Once `maxsize` messages are waiting, putting another one discards the
+    oldest droppable (stale preview) message. Messages put with
+    droppable=False (final frame, done) are never discarded, so a slow
+    client always receives the end of the stream.
+    """
+
+    def __init__(self, maxsize: int = 2):
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.maxsize = int(maxsize)
+        self._items: deque[tuple[Any, bool]] = deque()
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, msg: Any, droppable: bool = True) -> None:
+        if len(self._items) >= self.maxsize:
+            for i, (_, can_drop) in enumerate(self._items):
+                if can_drop:
+                    del self._items[i]
+                    self.dropped += 1
+                    break
+        self._items.append((msg, droppable))
+        self._ready.set()
+
+    async def get(self) -> Optional[Any]:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()[0]
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,355 @@
+from __future__ import annotations
+import logging
+import asyncio
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Literal, Optional, Tuple
+
+import numpy as np
+
+from app.domain.Diffusion import Diffusion
+from app.domain.ImageProcessor import ImageProcessor, get_profile, mime_for
+from app.domain.LRUCache import ByteBudgetLRU
+
+logger = logging.getLogger(__name__)
+
+SessionMode = Literal["chain", "closed_form"]
+
+EXPORT_PREFIX = "trajectory-"
+
+
+class ExportBudgetError(RuntimeError):
+    pass
+
+
+class SessionClosedError(RuntimeError):
+    pass
+
+
+class DiskBudget:
+    """
+    Bytes of on-disk trajectory exports across all sessions, under a cap.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> None:
+        with self._lock:
+            if self.nbytes + nbytes > self.max_bytes:
+                self.refused += 1
+                raise ExportBudgetError(
+                    f"export needs {nbytes} bytes; {self.max_bytes - self.nbytes} of the disk budget left"
+                )
+            self.nbytes += nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._lock:
+            self.nbytes -= nbytes
+
+
+def remove_stale_exports(tmp_dir: Optional[str] = None) -> int:
+    """
+    Delete export files left behind by this process's previous life (crash,
+    restart) or by processes that are gone. Files are named
+    trajectory-<pid>-*.npy; other live workers' files are kept.
+    """
+    tmp_dir = tmp_dir or tempfile.gettempdir()
+    removed = 0
+    for name in os.listdir(tmp_dir):
+        if not (name.startswith(EXPORT_PREFIX) and name.endswith(".npy")):
+            continue
+        pid = name[len(EXPORT_PREFIX):].split("-", 1)[0]
+        if not pid.isdigit() or (int(pid) != os.getpid() and _pid_alive(int(pid))):
+            continue
+        try:
+            os.remove(os.path.join(tmp_dir, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.info("Removed %d stale trajectory export(s) from %s", removed, tmp_dir)
+    return removed
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class DiffusionSession:
+    """
+    A Diffusion instance (x0, schedule, seed) kept server-side for random-access
+    frame requests. Frames come from the chain or the closed form
+    (fast_diffuse) and are kept encoded in a per-session LRU. A chain session
+    serves the trajectory /diffuse/ws streams with preview_every=stride:
+    the checkpointed chain (diffuse_at_t for stride 1, strided_at_t for the
+    strided jump chain, which only has frames at emitted_timesteps(stride)). With the same seed
+    the pixels match that WS run; the encoded bytes also match only if the
+    image format, profile and quality do too (WS previews default to the
+    fast-preview profile). A frame for a given (session id, t) never changes.
+    """
+
+    def __init__(
+        self,
+        inst: Diffusion,
+        mode: SessionMode,
+        stride: int,
+        image_format: str,
+        quality: Optional[int],
+        profile: str,
+        frame_budget: int,
+        disk: Optional[DiskBudget] = None,
+    ):
+        self.id = secrets.token_urlsafe(16)
+        self.inst = inst
+        self.mode = mode
+        self.stride = max(1, int(stride)) if mode == "chain" else 1
+        self._timesteps = frozenset(inst.emitted_timesteps(self.stride))
+        self.image_format = image_format.upper()
+        self.media_type = mime_for(self.image_format)
+        self.quality = quality  # None: the profile's own
+        self.profile = get_profile(profile)
+        self.frames = ByteBudgetLRU(frame_budget)
+        self.last_access = time.monotonic()
+        # Event-loop side of render(): in-flight renders by t, and one executor job at a time
+        self.renders: Dict[int, "asyncio.Future[bytes]"] = {}
+        self.render_lock = asyncio.Lock()
+        self.disk = disk
+        self._file: Optional[Tuple[Tuple[int, str], str, int]] = None  # ((stride, dtype), .npy path, bytes)
+        self._files_lock = threading.Lock()  # one export at a time (held by executor threads only)
+        self._state_lock = threading.Lock()  # closed/_exporting/_file; never held for long
+        self._exporting = False
+        self.closed = False
+
+    def has_frame(self, t: int) -> bool:
+        return t in self._timesteps
+
+    def cached_frame(self, t: int) -> Optional[bytes]:
+        return self.frames.get(t)
+
+    def render(self, t: int) -> bytes:
+        """
+        Encoded frame for t (blocking; run it in the executor). Callers
+        serialize renders per session (see SessionService.frame).
+        """
+        data = self.frames.get(t)
+        if data is None:
+            if self.mode == "chain":
+                frame = self.inst.strided_at_t(t, self.stride)
+            else:
+                frame = self.inst.fast_diffuse(t)
+            data = self._encode(frame)
+            self.frames.put(t, data)
+        return data
+
+    def encode(
+        self,
+        t: int,
+        frame: np.ndarray,
+        metrics_downsample: Optional[int] = None,
+        cache: bool = True,
+    ) -> Tuple[bytes, Optional[dict]]:
+        """
+        Encode a streamed chain frame (blocking). With cache=True it is also
+        cached, so a later GET of the same t is a hit; only pass that for
+        frames of the trajectory render() serves (the session's stride).
+        """
+        data = self.frames.peek(t) if cache else None
+        if data is None:
+            data = self._encode(frame)
+            if cache:
+                self.frames.put(t, data)
+        metrics = None
+        if metrics_downsample is not None:
+            metrics = self.inst.compute_metrics(frame, downsample=metrics_downsample)
+        return data, metrics
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        return ImageProcessor.array_to_bytes(frame, format=self.image_format, quality=self.quality, profile=self.profile)
+
+    def trajectory_file(self, stride: int, dtype: str, tmp_dir: Optional[str] = None) -> str:
+        """
+        Path of a .npy file holding the strided chain trajectory (blocking).
+        Written once through a memmap, then reused until the session goes away
+        or asks for another (stride, dtype); a session keeps one file at a
+        time. Readers can np.load(..., mmap_mode="r") it. Raises
+        ExportBudgetError when the file would not fit the disk budget and
+        SessionClosedError when the session is closed before it is done.
+        """
+        key = (int(stride), dtype)
+        with self._files_lock:
+            with self._state_lock:
+                if self.closed:
+                    raise SessionClosedError("session was closed")
+                if self._file is not None and self._file[0] == key:
+                    return self._file[1]
+                previous, self._file = self._file, None
+                self._exporting = True
+            entry = None
+            try:
+                self._remove(previous)
+                shape = (len(self.inst.emitted_timesteps(stride)), *self.inst.img_shape)
+                size = int(np.prod(shape)) * np.dtype(dtype).itemsize + 4096  # data + .npy header
+                if self.disk is not None:
+                    self.disk.reserve(size)
+                try:
+                    fd, path = tempfile.mkstemp(prefix=f"{EXPORT_PREFIX}{os.getpid()}-", suffix=".npy", dir=tmp_dir)
+                    os.close(fd)
+                except Exception:
+                    if self.disk is not None:
+                        self.disk.release(size)
+                    raise
+                entry = (key, path, size)
+                mm = np.lib.format.open_memmap(path, mode="w+", dtype=np.dtype(dtype), shape=shape)
+                for k, (_, _, frame) in enumerate(self.inst.frames(stride=stride, dtype=dtype)):
+                    if self.closed:
+                        raise SessionClosedError("session was closed")
+                    mm[k] = frame
+                mm.flush()
+                del mm
+            except Exception:
+                self._remove(entry)
+                with self._state_lock:
+                    self._exporting = False
+                raise
+            with self._state_lock:
+                self._exporting = False
+                if not self.closed:
+                    self._file = entry
+                    return path
+            # Closed while writing: close() left the file to us
+            self._remove(entry)
+            raise SessionClosedError("session was closed")
+
+    def close(self) -> None:
+        """
+        Mark the session closed and drop its export file. Never waits: a
+        running export notices the flag and removes its own file. Safe to
+        call from the event loop.
+        """
+        with self._state_lock:
+            self.closed = True
+            entry, self._file = self._file, None
+        self._remove(entry)
+
+    def _remove(self, entry: Optional[Tuple[Tuple[int, str], str, int]]) -> None:
+        if entry is None:
+            return
+        _, path, size = entry
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if self.disk is not None:
+            self.disk.release(size)
+
+    @property
+    def nbytes(self) -> int:
+        # x0 and the float32 work buffers, plus whatever the caches hold now
+        x0 = self.inst.x0.nbytes
+        return x0 + 3 * x0 + self.inst._checkpoints.nbytes + self.frames.nbytes
+
+
+class SessionStore:
+    """
+    Process-wide diffusion sessions under an idle TTL and a global memory
+    budget. Expired sessions go first; past the budget the least recently
+    used sessions are evicted.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: float, export_max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self.ttl_s = float(ttl_s)
+        self.disk = DiskBudget(export_max_bytes)  # trajectory files, on disk
+        self._sessions: OrderedDict[str, DiffusionSession] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def add(self, session: DiffusionSession) -> None:
+        with self._lock:
+            self._sessions[session.id] = session
+            removed = self._sweep()
+        _close_all(removed)
+
+    def get(self, session_id: str) -> Optional[DiffusionSession]:
+        with self._lock:
+            removed = self._sweep()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+        _close_all(removed)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.close()
+        return True
+
+    def enforce_budget(self) -> None:
+        # Sessions grow as frames and checkpoints are cached; call after renders
+        with self._lock:
+            removed = self._sweep()
+        _close_all(removed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(s.nbytes for s in self._sessions.values()),
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "export_bytes": self.disk.nbytes,
+                "export_max_bytes": self.disk.max_bytes,
+                "exports_refused": self.disk.refused,
+            }
+
+    # ---------- Internals ----------
+    def _sweep(self) -> List[DiffusionSession]:
+        # Caller holds the lock and closes the returned sessions after releasing
+        # it (close() removes files). Oldest access first, so expired ones lead.
+        removed = []
+        now = time.monotonic()
+        while self._sessions:
+            sid, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_access <= self.ttl_s:
+                break
+            del self._sessions[sid]
+            removed.append(oldest)
+            self.expirations += 1
+
+        total = sum(s.nbytes for s in self._sessions.values())
+        while total > self.max_bytes and len(self._sessions) > 1:
+            sid, victim = self._sessions.popitem(last=False)
+            total -= victim.nbytes
+            removed.append(victim)
+            self.evictions += 1
+            logger.info("Evicted diffusion session %s (memory budget)", sid)
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+def _close_all(sessions: List[DiffusionSession]) -> None:
+    for session in sessions:
+        session.close()
@@ -0,0 +1,58 @@
+"""
+Compare the full-decode and DCT-draft paths of ImageProcessor.decode_image.
+
+Run from backend/:
+    python -m benchmarks.bench_decode
+"""
+import base64
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.domain.ImageProcessor import ImageProcessor
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000), (6000, 4000)]  # up to 24 MP
+MAX_SIDE = 256
+REPEATS = 5
+
+
+def make_jpeg_b64(w: int, h: int) -> str:
+    # Smooth gradients plus mild noise: compresses like a photo, unlike pure noise
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    rng = np.random.default_rng(0)
+    img = np.stack([
+        127 + 100 * np.sin(xx / 97.0),
+        127 + 100 * np.cos(yy / 61.0),
+        127 + 100 * np.sin((xx + yy) / 143.0),
+    ], axis=-1) + rng.normal(0, 8, size=(h, w, 3))
+    buf = BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def time_decode(b64: str, fast: bool) -> tuple[float, str]:
+    best = float("inf")
+    path = ""
+    for _ in range(REPEATS):
+        ip = ImageProcessor(b64)
+        t0 = time.perf_counter()
+        ip.decode_image(max_side=MAX_SIDE, fast=fast)
+        best = min(best, time.perf_counter() - t0)
+        path = ip.decode_path
+    return best, path
+
+
+def main():
+    print(f"max_side={MAX_SIDE}, best of {REPEATS}")
+    print(f"{'input':>12} {'full ms':>10} {'fast ms':>10} {'path':>6} {'speedup':>8}")
+    for w, h in SIZES:
+        b64 = make_jpeg_b64(w, h)
+        full_s, _ = time_decode(b64, fast=False)
+        fast_s, path = time_decode(b64, fast=True)
+        print(f"{w:>5}x{h:<6} {1000 * full_s:>10.1f} {1000 * fast_s:>10.1f} {path:>6} {full_s / fast_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Encode time vs bytes for each encoder profile (JPEG and WebP) on frames
+early in the chain (mostly image) and late (mostly noise). "pillow-default"
+is what every encode produced before the profile settings reached save().
+
+Run from backend/:
+    python -m benchmarks.bench_encode
+"""
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.domain.ImageProcessor import ENCODER_PROFILES, ImageProcessor
+
+SIDES = [256, 512]
+ALPHA_BARS = {"early": 0.95, "late": 0.05}
+REPEATS = 5
+
+
+def test_image(side: int) -> np.ndarray:
+    # Smooth gradients plus a few hard edges, roughly photo-like for the codecs
+    y, x = np.mgrid[0:side, 0:side].astype(np.float32) / side
+    img = np.stack([x, y, 0.5 + 0.5 * np.sin(6 * np.pi * x * y)], axis=-1)
+    img[side // 4: side // 2, side // 4: side // 2] = (0.9, 0.2, 0.1)
+    return img
+
+
+def noisy(x0: np.ndarray, alpha_bar: float) -> np.ndarray:
+    eps = np.random.default_rng(0).standard_normal(x0.shape, dtype=np.float32)
+    xt = np.sqrt(alpha_bar) * x0 + np.sqrt(1 - alpha_bar) * eps
+    return (np.clip(xt, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def pillow_default(arr: np.ndarray, format: str) -> bytes:
+    buff = BytesIO()
+    Image.fromarray(arr, mode="RGB").save(buff, format=format)
+    return buff.getvalue()
+
+
+def measure(fn) -> tuple[float, int]:
+    size = len(fn())  # warm up
+    t0 = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return 1000 * (time.perf_counter() - t0) / REPEATS, size
+
+
+def main():
+    print(f"ms = mean encode time over {REPEATS} runs")
+    print(f"{'side':>5} {'frame':>6} {'format':>6} {'profile':>15} {'ms':>8} {'KiB':>8}")
+    for side in SIDES:
+        x0 = test_image(side)
+        for label, alpha_bar in ALPHA_BARS.items():
+            frame = noisy(x0, alpha_bar)
+            for format in ("JPEG", "WEBP"):
+                rows = [("pillow-default", lambda: pillow_default(frame, format))]
+                rows += [
+                    (name, lambda name=name: ImageProcessor.array_to_bytes(frame, format=format, profile=name))
+                    for name in ENCODER_PROFILES
+                ]
+                for name, fn in rows:
+                    ms, size = measure(fn)
+                    print(f"{side:>5} {label:>6} {format:>6} {name:>15} {ms:>8.2f} {size / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Per-step cost and allocations of the forward chain: the previous
+allocating step (float64 normal -> float32 cast, temporaries, fresh uint8)
+vs FrameEngine (float32 noise and in-place update/quantization).
+
+Run from backend/:
+    python -m benchmarks.bench_frames
+"""
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.domain.FrameEngine import FrameEngine
+
+SIDES = [256, 512, 1024]
+STEPS = 20
+BETA = np.float32(0.01)
+
+
+def old_step(xt: np.ndarray, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    eps = rng.normal(size=xt.shape, loc=0.0, scale=1.0).astype(np.float32)
+    xt = np.sqrt(1 - BETA) * xt + np.sqrt(BETA, dtype=np.float32) * eps
+    return xt, (np.clip(xt, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def run_old(x0: np.ndarray) -> None:
+    xt = x0
+    for i in range(STEPS):
+        xt, _ = old_step(xt, i)
+
+
+def run_engine(engine: FrameEngine, x0: np.ndarray) -> None:
+    engine.reset(x0)
+    c_x, c_eps = np.sqrt(1 - BETA), np.sqrt(BETA, dtype=np.float32)
+    for i in range(STEPS):
+        engine.draw_noise(i)
+        engine.step(c_x, c_eps)
+        engine.quantize()
+
+
+def measure(fn) -> tuple[float, float]:
+    fn()  # warm up
+    t0 = time.perf_counter()
+    fn()
+    per_step_ms = 1000 * (time.perf_counter() - t0) / STEPS
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_step_ms, peak / 1024
+
+
+def main():
+    print(f"{STEPS} steps per run; peak = tracemalloc peak over a whole warm run")
+    print(f"{'side':>5} {'old ms/step':>12} {'new ms/step':>12} {'old peak KiB':>13} {'new peak KiB':>13}")
+    for side in SIDES:
+        x0 = np.random.default_rng(0).random((side, side, 3), dtype=np.float32)
+        engine = FrameEngine(x0.shape)
+        old_ms, old_peak = measure(lambda: run_old(x0))
+        new_ms, new_peak = measure(lambda: run_engine(engine, x0))
+        print(f"{side:>5} {old_ms:>12.2f} {new_ms:>12.2f} {old_peak:>13.0f} {new_peak:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
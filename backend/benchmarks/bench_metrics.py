@@ -0,0 +1,77 @@
+"""
+Per-frame metric cost: float64 reference (Diffusion._compute_metrics with a
+rebuilt uint8 x0, as the WS service used to do) vs MetricsEngine, plus the
+max absolute error of the downsampled estimates.
+
+Run from backend/:
+    python -m benchmarks.bench_metrics
+"""
+import base64
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.domain.Diffusion import Diffusion
+
+SIDES = [256, 512, 1024]
+STEPS = 1000
+TIMESTEPS = [0, 10, 50, 100, 200, 400, 700, 999]
+REPEATS = 5
+
+
+def make_png_b64(side: int) -> str:
+    yy, xx = np.mgrid[0:side, 0:side].astype(np.float32)
+    rng = np.random.default_rng(0)
+    img = np.stack([
+        127 + 100 * np.sin(xx / 23.0),
+        127 + 100 * np.cos(yy / 17.0),
+        127 + 100 * np.sin((xx + yy) / 41.0),
+    ], axis=-1) + rng.normal(0, 12, size=(side, side, 3))
+    buf = BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
+
+
+def best_of(fn) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    print(f"{'side':>5} {'ref ms':>8} {'s=1 ms':>8} {'s=2 ms':>8} {'s=4 ms':>8} "
+          f"{'err s=1':>9} {'err s=2':>9} {'err s=4':>9}")
+    for side in SIDES:
+        inst = Diffusion(make_png_b64(side), STEPS, 1e-3, 2e-2, seed=0, max_side=side)
+        frames = [inst.fast_diffuse(t) for t in TIMESTEPS]
+        x0_u8 = (inst.x0 * 255.0 + 0.5).astype("uint8")
+
+        def reference():
+            for f in frames:
+                inst._compute_metrics(f, (inst.x0 * 255.0 + 0.5).astype("uint8"))
+
+        timings, errors = [], []
+        for s in (1, 2, 4):
+            inst.compute_metrics(frames[0], downsample=s)  # build x0 statistics once
+            timings.append(best_of(lambda: [inst.compute_metrics(f, downsample=s) for f in frames]))
+            err = 0.0
+            for f in frames:
+                ref = inst._compute_metrics(f, x0_u8)
+                got = inst.compute_metrics(f, downsample=s)
+                err = max(err, abs(got["SSIM"] - ref["SSIM"]), abs(got["Cosine"] - ref["Cosine"]))
+            errors.append(err)
+
+        ref_s = best_of(reference)
+        n = len(frames)
+        print(f"{side:>5} {1000 * ref_s / n:>8.2f} "
+              + " ".join(f"{1000 * t / n:>8.2f}" for t in timings) + " "
+              + " ".join(f"{e:>9.1e}" for e in errors))
+
+
+if __name__ == "__main__":
+    main()
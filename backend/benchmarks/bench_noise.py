@@ -0,0 +1,40 @@
+"""
+Gaussian noise throughput of NoiseProvider by thread count.
+
+Run from backend/:
+    python -m benchmarks.bench_noise
+"""
+import os
+import time
+
+import numpy as np
+
+from app.domain.Noise import NoiseProvider
+
+SIDES = [512, 1024, 2048]
+REPEATS = 5
+
+
+def main():
+    cores = os.cpu_count() or 1
+    counts = [n for n in (1, 2, 4, 8, 16) if n <= max(cores, 1)]
+    print(f"cpu_count={cores}; Msamples/s, best of {REPEATS}")
+    print(f"{'side':>5} " + " ".join(f"{f't={n}':>8}" for n in counts))
+    for side in SIDES:
+        out = np.empty((side, side, 3), dtype=np.float32)
+        row = []
+        for n in counts:
+            provider = NoiseProvider(threads=n)
+            provider.fill(out, 0)  # warm up pool
+            best = float("inf")
+            for seed in range(REPEATS):
+                t0 = time.perf_counter()
+                provider.fill(out, seed)
+                best = min(best, time.perf_counter() - t0)
+            provider.shutdown()
+            row.append(out.size / best / 1e6)
+        print(f"{side:>5} " + " ".join(f"{r:>8.0f}" for r in row))
+
+
+if __name__ == "__main__":
+    main()